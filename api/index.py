@@ -60,12 +60,15 @@ def handler(request):
         with flask_app.request_context(request):
             # Get the response from the Flask app
             response = flask_app.full_dispatch_request()
+            body = response.get_data(as_text=True)
+            # Runs the response's close callbacks, e.g. the jobs queued by the request
+            response.close()
             
             # Convert Flask response to Vercel response format
             return {
                 'statusCode': response.status_code,
                 'headers': dict(response.headers),
-                'body': response.get_data(as_text=True)
+                'body': body
             }
             
     except Exception as e:
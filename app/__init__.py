@@ -24,6 +24,31 @@ def create_app():
     app.config['SESSION_COOKIE_SECURE'] = True  # Enable for production
     app.config['SESSION_COOKIE_HTTPONLY'] = True
     app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
+    app.config['NOTIFICATION_POLL_TIMEOUT'] = int(os.environ.get('NOTIFICATION_POLL_TIMEOUT', 25))  # seconds a long-poll is held
+    app.config['NOTIFICATION_WATCH_INTERVAL'] = float(os.environ.get('NOTIFICATION_WATCH_INTERVAL', 1))  # seconds between checks for notifications written by other processes, 0 disables
+    app.config['STATS_CACHE_TTL'] = int(os.environ.get('STATS_CACHE_TTL', 60))  # seconds, 0 disables the cache
+    # Seconds the logged-in user's columns are cached, 0 disables the cache. Each worker
+    # has its own cache and invalidation only reaches the worker that made the change,
+    # so a deleted, demoted or re-passworded user stays logged in elsewhere this long.
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 5))
+    app.config['PRESENCE_TTL'] = int(os.environ.get('PRESENCE_TTL', 300))  # seconds a user stays "active" after their last request
+    app.config['PRESENCE_WRITE_INTERVAL'] = int(os.environ.get('PRESENCE_WRITE_INTERVAL', 60))  # seconds between last-seen writes for a user
+    app.config['FORUM_ACCESS_CACHE_TTL'] = int(os.environ.get('FORUM_ACCESS_CACHE_TTL', 300))  # seconds a user's permitted forums are cached
+    app.config['FORUM_STREAM_KEEPALIVE'] = int(os.environ.get('FORUM_STREAM_KEEPALIVE', 15))  # seconds between keepalive comments on forum streams
+    app.config['NOTIFICATION_RETENTION'] = os.environ.get('NOTIFICATION_RETENTION', '')  # read notification retention days per type, e.g. "info=7,default=30"
+    app.config['NOTIFICATION_PURGE_BATCH_SIZE'] = int(os.environ.get('NOTIFICATION_PURGE_BATCH_SIZE', 1000))
+    app.config['UPLOAD_CHUNK_SIZE'] = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # largest chunk accepted by the chunked upload API
+    app.config['UPLOAD_MAX_SIZE'] = int(os.environ.get('UPLOAD_MAX_SIZE', 500 * 1024 * 1024))  # largest file accepted by the chunked upload API
+    app.config['DOWNLOAD_OFFLOAD'] = os.environ.get('DOWNLOAD_OFFLOAD', '').lower()  # '', 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)
+    app.config['DOWNLOAD_ACCEL_PREFIX'] = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')  # internal nginx location aliasing UPLOAD_FOLDER
+    app.config['UPLOAD_EXPIRY_HOURS'] = int(os.environ.get('UPLOAD_EXPIRY_HOURS', 24))  # unattached uploads older than this are removed
+    app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 1))  # seconds an idle worker waits before checking the queue again
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    app.config['JOB_RETRY_DELAY'] = int(os.environ.get('JOB_RETRY_DELAY', 30))  # seconds before the first retry, doubled after each failure
+    app.config['JOB_LOCK_TIMEOUT'] = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))  # seconds after which a running job is considered abandoned
+    app.config['JOB_RETENTION_DAYS'] = int(os.environ.get('JOB_RETENTION_DAYS', 7))  # succeeded jobs are purged after this
+    # Run the jobs a request queued once its response is sent; set to 0 where run_worker.py is deployed
+    app.config['JOB_RUN_INLINE'] = os.environ.get('JOB_RUN_INLINE', '1').lower() not in ('0', 'false', 'no')
 
     db.init_app(app)
     login_manager.init_app(app)
@@ -52,4 +77,13 @@ def create_app():
     from .forum import forum as forum_blueprint
     app.register_blueprint(forum_blueprint)
 
+    from .uploads import uploads as uploads_blueprint
+    app.register_blueprint(uploads_blueprint)
+
+    from . import presence
+    presence.init_app(app)
+
+    from . import jobs
+    jobs.init_app(app)
+
     return app
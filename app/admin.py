@@ -1,18 +1,31 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, Response
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc
 from app import db
-from models.models import User, Task, Assignment, Submission, Notification, Class, Subject, ContactMessage, ChatRoom, ChatMessage
+from models.models import User, Task, Assignment, Submission, Notification, Broadcast, BroadcastReceipt, Class, Subject, ContactMessage, ChatRoom, ChatMessage, Job, invalidate_user
 from .forms import AdminUserForm, SystemConfigForm, BulkOperationForm, ClassForm, SubjectForm, AssignTeacherToSubjectForm, TaskForm
 from werkzeug.security import generate_password_hash
-from werkzeug.utils import secure_filename
 from ml.priority_predictor import predict_priority
+from .uploads import attach_file, delete_user_uploads
+from .file_store import release_attachments, set_attachment
+from .assignments import create_assignments, assign_class_tasks
+from .stats import get_site_stats
+from .forum_access import invalidate_forum_access
+from .notifications import queue_notifications
+from .jobs import job_counts, retry_job
 import csv
 import os
 
 admin = Blueprint('admin', __name__)
 
+def _existing_user_ids(user_ids):
+    """Keep the ids from a submitted form that belong to existing users, in one query"""
+    user_ids = [int(user_id) for user_id in user_ids]
+    if not user_ids:
+        return []
+    return [user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(user_ids)).all()]
+
 @admin.before_request
 def require_admin():
     if not current_user.is_authenticated or current_user.user_type != 'admin':
@@ -23,18 +36,12 @@ def require_admin():
 @admin.route('/dashboard')
 @login_required
 def dashboard():
-    # System statistics
-    stats = {
-        'total_users': User.query.count(),
-        'total_teachers': User.query.filter_by(user_type='teacher').count(),
-        'total_students': User.query.filter_by(user_type='student').count(),
-        'total_classes': Class.query.count(),
-        'total_tasks': Task.query.count(),
-        'total_assignments': Assignment.query.count(),
-        'total_submissions': Submission.query.count(),
-        'completed_assignments': Assignment.query.filter_by(status='completed').count(),
-        'overdue_tasks': Task.query.filter(Task.deadline < datetime.utcnow()).count()
-    }
+    # System statistics (cached snapshot shared with the homepage)
+    site_stats = get_site_stats()
+    stats = {key: site_stats[key] for key in (
+        'total_users', 'total_teachers', 'total_students', 'total_classes', 'total_tasks',
+        'total_assignments', 'total_submissions', 'completed_assignments', 'overdue_tasks'
+    )}
     
     # Recent activity
     recent_users = User.query.order_by(desc(User.created_at)).limit(5).all()
@@ -42,11 +49,10 @@ def dashboard():
     recent_submissions = Submission.query.order_by(desc(Submission.submitted_at)).limit(5).all()
     
     # Weekly activity (last 7 days)
-    week_ago = datetime.utcnow() - timedelta(days=7)
     weekly_stats = {
-        'new_users': User.query.filter(User.created_at >= week_ago).count(),
-        'new_tasks': Task.query.filter(Task.created_at >= week_ago).count(),
-        'new_submissions': Submission.query.filter(Submission.submitted_at >= week_ago).count()
+        'new_users': site_stats['new_users'],
+        'new_tasks': site_stats['new_tasks'],
+        'new_submissions': site_stats['new_submissions']
     }
     
     return render_template('admin_dashboard.html', 
@@ -81,11 +87,16 @@ def edit_user(user_id):
         form.teaching_subjects.data = [s.id for s in user.selected_subjects]
 
     if form.validate_on_submit():
+        previous_class_id = user.class_id
         user.name = form.name.data
         user.email = form.email.data
         user.user_type = form.user_type.data
         user.class_id = form.class_id.data
 
+        # Give students moved to another class the tasks of their new class
+        if user.user_type == 'student' and user.class_id != previous_class_id:
+            assign_class_tasks(user, commit=False)
+
         # Handle teaching classes for teachers
         if user.user_type == 'teacher':
             user.teaching_classes = []
@@ -123,6 +134,8 @@ def edit_user(user_id):
             user.set_password(form.new_password.data)
 
         db.session.commit()
+        invalidate_user(user.id)
+        invalidate_forum_access(user.id)
         flash(f'User {user.name} updated successfully!')
         return redirect(url_for('admin.manage_users'))
 
@@ -141,11 +154,16 @@ def delete_user(user_id):
     # Delete submissions for assignments belonging to this user
     assignment_ids = [assignment.id for assignment in Assignment.query.filter_by(student_id=user.id).all()]
     if assignment_ids:
+        release_attachments(Submission, Submission.assignment_id.in_(assignment_ids))
         Submission.query.filter(Submission.assignment_id.in_(assignment_ids)).delete(synchronize_session=False)
     
     Assignment.query.filter_by(student_id=user.id).delete()
+    release_attachments(Task, Task.created_by == user.id)
     Task.query.filter_by(created_by=user.id).delete()
     Notification.query.filter_by(user_id=user.id).delete()
+    BroadcastReceipt.query.filter_by(user_id=user.id).delete()
+    Broadcast.query.filter_by(created_by=user.id).update({'created_by': None})
+    delete_user_uploads(user.id, commit=False)
     
     # Delete chat messages sent by this user
     ChatMessage.query.filter_by(user_id=user.id).delete()
@@ -155,6 +173,8 @@ def delete_user(user_id):
     
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(user.id)
+    invalidate_forum_access(user.id)
     flash(f'User {user.name} and all related data deleted successfully!')
     return redirect(url_for('admin.manage_users'))
 
@@ -206,6 +226,11 @@ def create_user():
         
         db.session.add(user)
         db.session.commit()
+
+        # Give new students the tasks already assigned to their class
+        if user.user_type == 'student':
+            assign_class_tasks(user)
+
         flash(f'User {user.name} created successfully!')
         return redirect(url_for('admin.manage_users'))
 
@@ -260,10 +285,12 @@ def delete_task(task_id):
     # Delete submissions for assignments belonging to this task
     assignment_ids = [assignment.id for assignment in Assignment.query.filter_by(task_id=task.id).all()]
     if assignment_ids:
+        release_attachments(Submission, Submission.assignment_id.in_(assignment_ids))
         Submission.query.filter(Submission.assignment_id.in_(assignment_ids)).delete(synchronize_session=False)
     
     Assignment.query.filter_by(task_id=task.id).delete()
     
+    release_attachments(Task, Task.id == task.id)
     db.session.delete(task)
     db.session.commit()
     flash(f'Task "{task.title}" and all related data deleted successfully!')
@@ -336,15 +363,16 @@ def create_notification():
         target_users = request.form.get('target_users', 'all')
         
         # Create system notification
-        Notification.create_system_notification(
+        sent_count = Notification.create_system_notification(
             title=title,
             message=message,
             notification_type=notification_type,
             target_users=target_users,
-            expires_in_hours=168  # 1 week
+            expires_in_hours=168,  # 1 week
+            created_by=current_user.id
         )
         
-        flash('System notification sent successfully!')
+        flash(f'System notification sent successfully to {sent_count} user(s)!')
         return redirect(url_for('admin.dashboard'))
     
     return render_template('admin_create_notification.html')
@@ -528,15 +556,7 @@ def create_task():
             form.priority.data = suggested_priority
 
         # Handle file upload
-        file_path = None
-        if form.task_file.data:
-            filename = secure_filename(form.task_file.data.filename)
-            if filename:
-                # Create unique filename
-                import uuid
-                unique_filename = str(uuid.uuid4()) + '_' + filename
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                form.task_file.data.save(file_path)
+        attached = attach_file(form.task_file.data, form.upload_id.data, 'task')
 
         # Get assigned teacher ID (None if 0)
         assigned_teacher_id = form.assigned_teacher_id.data if form.assigned_teacher_id.data != 0 else None
@@ -547,104 +567,61 @@ def create_task():
             deadline=form.deadline.data,
             priority=form.priority.data,
             instructions=form.instructions.data,
-            file_path=file_path,
             created_by=current_user.id,
             assigned_teacher_id=assigned_teacher_id
         )
+        set_attachment(task, attached)
         db.session.add(task)
-        db.session.commit()
+        db.session.flush()
 
         # Add assigned classes to the task
         if form.assigned_classes.data:
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj:
-                    task.assigned_classes.append(class_obj)
-            db.session.commit()
-
-        # Create assignments for students
-        assigned_students = []
-        
-        # First, assign to specific students if selected
-        if form.assigned_students.data:
-            for student_id in form.assigned_students.data:
-                student = User.query.get(int(student_id))
-                if student:
-                    existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                    if not existing:
-                        assignment = Assignment(
-                            task_id=task.id,
-                            student_id=student.id
-                        )
-                        db.session.add(assignment)
-                        assigned_students.append(student.id)
-        
-        # Then, assign to students in selected classes (if no specific students selected)
-        if not form.assigned_students.data and form.assigned_classes.data:
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj:
-                    for student in class_obj.students:
-                        existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                        if not existing:
-                            assignment = Assignment(
-                                task_id=task.id,
-                                student_id=student.id
-                            )
-                            db.session.add(assignment)
-                            assigned_students.append(student.id)
-        
-        db.session.commit()
-
-        # Create notifications for assigned students
-        for student_id in assigned_students:
-            student = User.query.get(student_id)
-            if student:
-                notification = Notification(
-                    user_id=student_id,
-                    title="New Task Assigned",
-                    message=f"Task '{task.title}' has been assigned by {current_user.name}",
-                    notification_type='info'
-                )
-                db.session.add(notification)
+            task.assigned_classes = Class.query.filter(Class.id.in_(form.assigned_classes.data)).all()
+
+        # Assign to specific students if selected, otherwise to the students of the selected classes
+        create_assignments(
+            task,
+            student_ids=form.assigned_students.data,
+            class_ids=form.assigned_classes.data if not form.assigned_students.data else None,
+            teacher_name=current_user.name,
+            commit=False
+        )
         
+        # Notifications are created by the background worker; the task, its
+        # assignments and the jobs are committed together. The keys include the
+        # creation time since SQLite may reuse the ids of deleted tasks.
         # Notify the assigned teacher
         if assigned_teacher_id:
-            teacher = User.query.get(assigned_teacher_id)
-            if teacher:
-                notification = Notification(
-                    user_id=teacher.id,
-                    title='Task Assigned to You',
-                    message=f'A task "{task.title}" has been assigned to you by admin {current_user.name}.',
-                    notification_type='task'
-                )
-                db.session.add(notification)
+            queue_notifications(
+                _existing_user_ids([assigned_teacher_id]),
+                title='Task Assigned to You',
+                message=f'A task "{task.title}" has been assigned to you by admin {current_user.name}.',
+                notification_type='task',
+                key=f'task:{task.id}:{task.created_at:%Y%m%d%H%M%S%f}:assigned-teacher',
+                commit=False
+            )
         
         # Notify selected teachers (for class notification)
-        notify_teachers = request.form.getlist('notify_teachers')
-        for teacher_id in notify_teachers:
-            teacher = User.query.get(int(teacher_id))
-            if teacher:
-                notification = Notification(
-                    user_id=teacher.id,
-                    title='Task Assigned to Class',
-                    message=f'A task "{task.title}" has been assigned by admin {current_user.name}.',
-                    notification_type='task'
-                )
-                db.session.add(notification)
+        notify_teachers = _existing_user_ids(request.form.getlist('notify_teachers'))
+        queue_notifications(
+            notify_teachers,
+            title='Task Assigned to Class',
+            message=f'A task "{task.title}" has been assigned by admin {current_user.name}.',
+            notification_type='task',
+            key=f'task:{task.id}:{task.created_at:%Y%m%d%H%M%S%f}:notify-teachers',
+            commit=False
+        )
         
         # Notify selected admins
-        notify_admins = request.form.getlist('notify_admins')
-        for admin_id in notify_admins:
-            admin = User.query.get(int(admin_id))
-            if admin:
-                notification = Notification(
-                    user_id=admin.id,
-                    title='Task Created',
-                    message=f'A new task "{task.title}" has been created by admin {current_user.name}.',
-                    notification_type='task'
-                )
-                db.session.add(notification)
+        notify_admins = _existing_user_ids(request.form.getlist('notify_admins'))
+        queue_notifications(
+            notify_admins,
+            title='Task Created',
+            message=f'A new task "{task.title}" has been created by admin {current_user.name}.',
+            notification_type='task',
+            key=f'task:{task.id}:{task.created_at:%Y%m%d%H%M%S%f}:notify-admins',
+            commit=False
+        )
         
         db.session.commit()
 
@@ -676,79 +653,38 @@ def assign_task_to_users(task_id):
         assign_teachers = request.form.getlist('assign_teachers')
         assign_admins = request.form.getlist('assign_admins')
         
-        assigned_count = 0
-        
-        # Assign to specific students
-        for student_id in assign_students:
-            student = User.query.get(int(student_id))
-            if student:
-                existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                if not existing:
-                    assignment = Assignment(
-                        task_id=task.id,
-                        student_id=student.id
-                    )
-                    db.session.add(assignment)
-                    assigned_count += 1
-                    
-                    # Create notification
-                    notification = Notification(
-                        user_id=student.id,
-                        title="New Task Assigned",
-                        message=f"Task '{task.title}' has been assigned by {current_user.name}",
-                        notification_type='info'
-                    )
-                    db.session.add(notification)
+        # Add classes to task's assigned classes
+        if assign_classes:
+            assigned_class_ids = {c.id for c in task.assigned_classes}
+            task.assigned_classes.extend(
+                c for c in Class.query.filter(Class.id.in_(assign_classes)).all() if c.id not in assigned_class_ids
+            )
         
-        # Assign to students in classes
-        for class_id in assign_classes:
-            class_obj = Class.query.get(int(class_id))
-            if class_obj:
-                # Add class to task's assigned classes
-                if class_obj not in task.assigned_classes:
-                    task.assigned_classes.append(class_obj)
-                
-                for student in class_obj.students:
-                    existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                    if not existing:
-                        assignment = Assignment(
-                            task_id=task.id,
-                            student_id=student.id
-                        )
-                        db.session.add(assignment)
-                        assigned_count += 1
-                        
-                        # Create notification
-                        notification = Notification(
-                            user_id=student.id,
-                            title="New Task Assigned",
-                            message=f"Task '{task.title}' has been assigned by {current_user.name}",
-                            notification_type='info'
-                        )
-                        db.session.add(notification)
+        # Assign to specific students and to students in classes
+        assigned_count = create_assignments(
+            task,
+            student_ids=assign_students,
+            class_ids=assign_classes,
+            teacher_name=current_user.name,
+            commit=False
+        )
         
         # Note: Teachers and admins don't have assignments, but we can send them notifications
-        for teacher_id in assign_teachers:
-            teacher = User.query.get(int(teacher_id))
-            if teacher:
-                notification = Notification(
-                    user_id=teacher.id,
-                    title='Task Assigned to Class',
-                    message=f'A task "{task.title}" has been assigned to a class you teach.',
-                    notification_type='task'
-                )
-                db.session.add(notification)
+        queue_notifications(
+            _existing_user_ids(assign_teachers),
+            title='Task Assigned to Class',
+            message=f'A task "{task.title}" has been assigned to a class you teach.',
+            notification_type='task',
+            commit=False
+        )
         
-        for admin_id in assign_admins:
-            admin = User.query.get(int(admin_id))
-            if admin:
-                notification = Notification(
-                    user_id=admin.id,
-                    title='Task Assigned',
-                    message=f'A task "{task.title}" has been assigned by admin {current_user.name}.',
-                    notification_type='task'
-                )
-                db.session.add(notification)
+        queue_notifications(
+            _existing_user_ids(assign_admins),
+            title='Task Assigned',
+            message=f'A task "{task.title}" has been assigned by admin {current_user.name}.',
+            notification_type='task',
+            commit=False
+        )
         
         db.session.commit()
         
@@ -766,14 +702,11 @@ def assign_task_to_users(task_id):
 @login_required
 def api_stats():
     """API endpoint for dashboard statistics"""
-    stats = {
-        'total_users': User.query.count(),
-        'total_teachers': User.query.filter_by(user_type='teacher').count(),
-        'total_students': User.query.filter_by(user_type='student').count(),
-        'total_classes': Class.query.count(),
-        'total_tasks': Task.query.count(),
-        'completed_assignments': Assignment.query.filter_by(status='completed').count()
-    }
+    site_stats = get_site_stats()
+    stats = {key: site_stats[key] for key in (
+        'total_users', 'total_teachers', 'total_students', 'total_classes', 'total_tasks',
+        'completed_assignments'
+    )}
     return jsonify(stats)
 
 @admin.route('/class/<int:class_id>/subjects')
@@ -800,6 +733,31 @@ def manage_class_subjects(class_id):
                          teachers=teachers,
                          forms=forms)
 
+# Background Job Routes
+@admin.route('/jobs')
+@login_required
+def view_jobs():
+    """Status of the background job queue, with the latest jobs"""
+    status = request.args.get('status', 'all')
+    
+    query = Job.query
+    if status in Job.STATUSES:
+        query = query.filter_by(status=status)
+    jobs = query.order_by(desc(Job.id)).limit(100).all()
+    
+    return render_template('admin_jobs.html', jobs=jobs, status=status, counts=job_counts())
+
+@admin.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_failed_job(job_id):
+    """Queue a failed job again"""
+    if retry_job(job_id):
+        db.session.commit()
+        flash(f'Job #{job_id} queued again.', 'success')
+    else:
+        flash(f'Job #{job_id} is not a failed job.', 'warning')
+    return redirect(url_for('admin.view_jobs', status=request.args.get('status', 'all')))
+
 # Contact Message Management Routes
 @admin.route('/contact-messages')
 @login_required
@@ -906,6 +864,7 @@ def assign_teacher_to_subject(class_id, subject_id):
             ))
         
         db.session.commit()
+        invalidate_forum_access(teacher.id)
         flash(f'Teacher "{teacher.name}" has been assigned to subject "{subject.name}" in class "{class_obj.name}".', 'success')
     else:
         flash('Error assigning teacher. Please try again.', 'danger')
@@ -932,5 +891,6 @@ def remove_teacher_from_subject(class_id, subject_id, teacher_id):
             teacher.teaching_classes.remove(class_obj)
     
     db.session.commit()
+    invalidate_forum_access(teacher.id)
     flash(f'Teacher "{teacher.name}" has been removed from subject "{subject.name}".', 'success')
     return redirect(url_for('admin.manage_class_subjects', class_id=class_id))
\ No newline at end of file
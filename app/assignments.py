@@ -0,0 +1,184 @@
+from datetime import datetime
+from sqlalchemy import Integer, and_, literal, or_, select
+from sqlalchemy.orm import contains_eager, selectinload
+from app import db
+from app.file_store import release_attachments
+from models.models import Assignment, Class, Submission, Task, User, task_classes
+
+
+def _missing_pairs(candidates):
+    """Return the (task_id, student_id) pairs from a candidate select that have no assignment yet"""
+    candidates = candidates.subquery()
+    stmt = select(candidates.c.task_id, candidates.c.student_id).outerjoin(
+        Assignment,
+        and_(
+            Assignment.task_id == candidates.c.task_id,
+            Assignment.student_id == candidates.c.student_id
+        )
+    ).where(Assignment.id.is_(None))
+    return db.session.execute(stmt).all()
+
+
+def _insert_assignments(pairs):
+    """Bulk insert pending assignments for the given (task_id, student_id) pairs"""
+    if pairs:
+        db.session.execute(Assignment.__table__.insert(), [
+            {'task_id': task_id, 'student_id': student_id, 'status': 'pending'}
+            for task_id, student_id in pairs
+        ])
+
+
+def create_assignments(task, student_ids=None, class_ids=None, teacher_name=None, commit=True):
+    """Assign a task to students picked directly and/or through their classes.
+
+    Target students are resolved in one query and students that already have the
+    task are skipped with an anti-join. The new assignments are bulk inserted and
+    their notifications queued for the background worker in the same transaction.
+    Returns the number of assignments created; no notifications are sent when
+    ``teacher_name`` is None.
+    """
+    student_ids = [int(student_id) for student_id in student_ids or []]
+    class_ids = [int(class_id) for class_id in class_ids or []]
+    if not student_ids and not class_ids:
+        return 0
+
+    criteria = []
+    if student_ids:
+        criteria.append(User.id.in_(student_ids))
+    if class_ids:
+        criteria.append(User.class_id.in_(class_ids))
+
+    candidates = select(
+        literal(task.id, Integer).label('task_id'),
+        User.id.label('student_id')
+    ).where(User.user_type == 'student', or_(*criteria))
+
+    pairs = _missing_pairs(candidates)
+    _insert_assignments(pairs)
+
+    if pairs and teacher_name is not None:
+        from app.notifications import notify_task_assigned_many
+        notify_task_assigned_many([student_id for _, student_id in pairs], task.title, teacher_name, commit=False)
+
+    if commit:
+        db.session.commit()
+    return len(pairs)
+
+
+def assign_class_tasks(student, notify=True, commit=True):
+    """Give a student every task assigned to their class that they don't have yet.
+
+    Returns the number of assignments created.
+    """
+    if not student.class_id:
+        return 0
+
+    candidates = select(
+        Task.id.label('task_id'),
+        literal(student.id, Integer).label('student_id')
+    ).join(task_classes, task_classes.c.task_id == Task.id).where(
+        task_classes.c.class_id == student.class_id
+    )
+
+    pairs = _missing_pairs(candidates)
+    _insert_assignments(pairs)
+
+    if pairs and notify:
+        from app.notifications import notify_task_assigned_many
+        tasks = db.session.query(Task.title, User.name).join(
+            User, Task.created_by == User.id
+        ).filter(Task.id.in_([task_id for task_id, _ in pairs])).all()
+        for task_title, teacher_name in tasks:
+            notify_task_assigned_many([student.id], task_title, teacher_name, commit=False)
+
+    if commit:
+        db.session.commit()
+    return len(pairs)
+
+
+def sync_task_classes(task, class_ids, teacher_name=None, commit=True):
+    """Make the students of ``class_ids`` the only assignees of a task.
+
+    Assignments (and their submissions) of students outside the selected classes
+    are removed, missing ones are created through ``create_assignments``. Returns the
+    number of assignments created.
+    """
+    class_ids = [int(class_id) for class_id in class_ids]
+    task.assigned_classes = Class.query.filter(Class.id.in_(class_ids)).all() if class_ids else []
+
+    in_classes = select(User.id).where(User.class_id.in_(class_ids))
+    stale_ids = select(Assignment.id).where(
+        Assignment.task_id == task.id,
+        Assignment.student_id.notin_(in_classes)
+    )
+    release_attachments(Submission, Submission.assignment_id.in_(stale_ids))
+    Submission.query.filter(Submission.assignment_id.in_(stale_ids)).delete(synchronize_session=False)
+    Assignment.query.filter(Assignment.id.in_(stale_ids)).delete(synchronize_session=False)
+
+    created = create_assignments(task, class_ids=class_ids, teacher_name=teacher_name, commit=False)
+    if commit:
+        db.session.commit()
+    return created
+
+
+def reconcile_class_assignments(notify=True):
+    """Materialize the missing assignments of every active class task.
+
+    Meant to run in the background (see ``reconcile_assignments.py``) so that
+    students who joined or changed class after a task was assigned still get it,
+    without the dashboards having to write on every page view. Also removes
+    orphaned assignments and marks pending assignments past their deadline as
+    overdue. Returns a dict with the number of rows touched by each step.
+    """
+    now = datetime.utcnow()
+
+    candidates = select(
+        Task.id.label('task_id'),
+        User.id.label('student_id')
+    ).join(task_classes, task_classes.c.task_id == Task.id).join(
+        User, User.class_id == task_classes.c.class_id
+    ).where(User.user_type == 'student', Task.deadline > now)
+
+    pairs = _missing_pairs(candidates)
+    _insert_assignments(pairs)
+
+    if pairs and notify:
+        from app.notifications import notify_task_assigned_many
+        students_by_task = {}
+        for task_id, student_id in pairs:
+            students_by_task.setdefault(task_id, []).append(student_id)
+        tasks = db.session.query(Task.id, Task.title, User.name).join(
+            User, Task.created_by == User.id
+        ).filter(Task.id.in_(students_by_task)).all()
+        for task_id, task_title, teacher_name in tasks:
+            notify_task_assigned_many(students_by_task[task_id], task_title, teacher_name, commit=False)
+
+    orphaned = Assignment.query.filter(
+        Assignment.task_id.notin_(select(Task.id))
+    ).delete(synchronize_session=False)
+
+    overdue = Assignment.query.filter(
+        Assignment.status == 'pending',
+        Assignment.task_id.in_(select(Task.id).where(Task.deadline < now))
+    ).update({'status': 'overdue'}, synchronize_session=False)
+
+    db.session.commit()
+    return {'created': len(pairs), 'orphaned': orphaned, 'overdue': overdue}
+
+
+def student_assignments(student_id, active_only=False):
+    """Load a student's assignments with their tasks and submissions, read-only.
+
+    Assignments come sorted by task priority then deadline, and those whose task
+    has been deleted are left out by the inner join. With ``active_only`` only
+    tasks whose deadline hasn't passed are returned.
+    """
+    query = Assignment.query.join(Assignment.task).options(
+        contains_eager(Assignment.task),
+        selectinload(Assignment.submissions)
+    ).filter(Assignment.student_id == student_id)
+
+    if active_only:
+        query = query.filter(Task.deadline > datetime.utcnow())
+
+    return query.order_by(Task.priority_rank, Task.deadline).all()
@@ -3,8 +3,9 @@ from flask_login import login_user, logout_user, login_required, current_user
 from urllib.parse import urlparse
 from datetime import datetime
 from app import db
-from models.models import User, Class, Task, Assignment, Notification, task_classes
+from models.models import User, Class
 from .forms import LoginForm, TeacherRegistrationForm, StudentRegistrationForm
+from .assignments import assign_class_tasks
 
 auth = Blueprint('auth', __name__)
 
@@ -68,34 +69,7 @@ def register_student():
         db.session.commit()
         
         # Auto-assign tasks to the new student based on class assignments
-        student_class_id = form.class_id.data
-        
-        # Find all tasks assigned to this class (using the assigned_classes relationship)
-        tasks = Task.query.join(task_classes).filter(
-            task_classes.c.class_id == student_class_id
-        ).all()
-        
-        # Create assignments for tasks not already assigned to this student
-        for task in tasks:
-            existing = Assignment.query.filter_by(task_id=task.id, student_id=user.id).first()
-            if not existing:
-                assignment = Assignment(
-                    task_id=task.id,
-                    student_id=user.id,
-                    status='pending'
-                )
-                db.session.add(assignment)
-                
-                # Create notification
-                notification = Notification(
-                    user_id=user.id,
-                    title='New Task Assignment',
-                    message=f'You have been assigned a new task: "{task.title}". Deadline: {task.deadline.strftime("%Y-%m-%d %H:%M")}',
-                    notification_type='task'
-                )
-                db.session.add(notification)
-        
-        db.session.commit()
+        assign_class_tasks(user)
         
         flash('Congratulations, you are now a registered student!')
         return redirect(url_for('auth.login'))
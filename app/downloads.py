@@ -0,0 +1,179 @@
+from flask import current_app, request
+from sqlalchemy import and_, select
+from urllib.parse import quote
+from werkzeug.utils import secure_filename, send_file
+from app import db
+from models.models import Assignment, Class, Submission, Task, User, attachment_name, attachment_path
+from datetime import datetime
+import csv
+import io
+import os
+import zipfile
+
+# Bytes read from disk at a time when archiving files
+ARCHIVE_BLOCK_SIZE = 64 * 1024
+
+MANIFEST_HEADER = ['Student', 'Email', 'Class', 'Status', 'Submitted At', 'Score', 'Feedback', 'Feedback At', 'File']
+
+
+def _file_columns(model):
+    return (model.file_sha256, model.legacy_file_path, model.file_name)
+
+
+def submission_file(submission_id):
+    """A submission's file columns with its assignment and the creator of its task, in one query"""
+    return db.session.execute(
+        select(Submission.assignment_id, Task.created_by, *_file_columns(Submission))
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .join(Task, Task.id == Assignment.task_id)
+        .where(Submission.id == submission_id)
+    ).first()
+
+
+def task_file(task_id, student_id=None):
+    """A task's file columns and creator, in one query.
+
+    With ``student_id`` the row also has the ``assignment_id`` of that student
+    for the task, None when they aren't assigned to it.
+    """
+    stmt = select(Task.created_by, *_file_columns(Task)).where(Task.id == task_id)
+    if student_id is not None:
+        stmt = stmt.add_columns(Assignment.id.label('assignment_id')).outerjoin(
+            Assignment, and_(Assignment.task_id == Task.id, Assignment.student_id == student_id)
+        )
+    return db.session.execute(stmt).first()
+
+
+def send_attachment(row):
+    """Response sending the file of a task or submission row, None when there is no file.
+
+    Stored files use their SHA-256 as a strong ETag, so clients revalidating
+    with ``If-None-Match`` get a 304, and ``Range`` requests are answered with
+    partial content. With ``DOWNLOAD_OFFLOAD`` set the body is left to the front
+    proxy through ``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache,
+    lighttpd), which then also serves the ranges.
+    """
+    path = attachment_path(row.file_sha256, row.legacy_file_path)
+    if not path:
+        return None
+
+    offload = current_app.config['DOWNLOAD_OFFLOAD']
+    relative_path = os.path.relpath(path, current_app.config['UPLOAD_FOLDER'])
+    if offload == 'x-accel-redirect' and relative_path.startswith('..'):
+        offload = ''  # outside of the location the proxy serves
+
+    try:
+        response = send_file(
+            path,
+            request.environ,
+            as_attachment=True,
+            download_name=attachment_name(row.file_name, row.legacy_file_path),
+            etag=row.file_sha256 or True,
+            conditional=not offload,
+            use_x_sendfile=bool(offload),
+            response_class=current_app.response_class
+        )
+    except FileNotFoundError:
+        return None
+
+    if offload:
+        if offload == 'x-accel-redirect':
+            del response.headers['X-Sendfile']
+            response.headers['X-Accel-Redirect'] = (
+                current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + quote(relative_path.replace(os.sep, '/'))
+            )
+        response = response.make_conditional(request.environ)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+
+    # Only for the logged-in user, and revalidated on every use
+    response.cache_control.private = True
+    return response
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, unseekable sink collecting what ``zipfile`` writes until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _archive_rows(task_id):
+    """One row per assignment of a task with its student and submissions, in one query"""
+    return db.session.execute(
+        select(
+            Submission.id.label('submission_id'), User.name, User.email, Class.name.label('class_name'),
+            Assignment.status, Submission.submitted_at, Submission.score, Submission.feedback,
+            Submission.feedback_provided_at, *_file_columns(Submission)
+        )
+        .select_from(Assignment)
+        .join(User, User.id == Assignment.student_id)
+        .outerjoin(Class, Class.id == User.class_id)
+        .outerjoin(Submission, Submission.assignment_id == Assignment.id)
+        .where(Assignment.task_id == task_id)
+        .order_by(User.name, Submission.id)
+    ).all()
+
+
+def _format_time(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def submissions_archive(task_id):
+    """Iterator over a ZIP with every submission file of a task and a ``manifest.csv``.
+
+    The rows are loaded right away and the database connection is given back
+    before anything streams. Files are then copied into the archive block by
+    block as the client reads it. They are not compressed, since submissions are
+    mostly compressed formats already. Memory use stays flat whatever the
+    archive size, and the download starts right away. Files missing on disk are
+    left out and have no name in the manifest.
+    """
+    files = []
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(MANIFEST_HEADER)
+    for row in _archive_rows(task_id):
+        arcname = ''
+        path = attachment_path(row.file_sha256, row.legacy_file_path)
+        if path and os.path.isfile(path):
+            name = secure_filename(attachment_name(row.file_name, row.legacy_file_path)) or 'file'
+            arcname = f"{secure_filename(row.name) or 'student'}_{row.submission_id}_{name}"
+            files.append((arcname, path, row.submitted_at))
+        writer.writerow([
+            row.name, row.email, row.class_name or '', row.status, _format_time(row.submitted_at),
+            '' if row.score is None else row.score, row.feedback or '', _format_time(row.feedback_provided_at), arcname
+        ])
+    db.session.close()
+
+    return _stream_archive(manifest.getvalue(), files)
+
+
+def _stream_archive(manifest, files):
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        archive.writestr('manifest.csv', manifest, compress_type=zipfile.ZIP_DEFLATED)
+        yield stream.drain()
+
+        for arcname, path, submitted_at in files:
+            info = zipfile.ZipInfo(arcname, date_time=(submitted_at or datetime.utcnow()).timetuple()[:6])
+            info.file_size = os.path.getsize(path)  # lets zipfile pick ZIP64 for large files up front
+            with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                for block in iter(lambda: source.read(ARCHIVE_BLOCK_SIZE), b''):
+                    target.write(block)
+                    yield stream.drain()
+    # Central directory
+    yield stream.drain()
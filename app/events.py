@@ -0,0 +1,141 @@
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import itertools
+import threading
+import time
+
+
+class LocalEventHub:
+    """In-process publish/subscribe hub.
+
+    Events are published to named channels (e.g. ``user:42`` or ``room:7``) and
+    numbered with a per-channel sequence. Subscribers remember the last sequence
+    they saw and block in ``wait`` until a newer event arrives or the timeout
+    expires. Each channel has its own condition variable, so publishing only
+    wakes the clients waiting on that channel, and the waits are cooperative
+    under gevent workers, so idle subscribers don't cost a thread each.
+
+    Channels nobody has waited on for ``idle_ttl`` seconds are dropped with
+    their buffered events, so notifying many users doesn't keep a channel per
+    user alive for the life of the process. Clients reconnecting within that
+    time still see what was published while they were away.
+
+    Only clients connected to the same process are woken. With several gunicorn
+    workers an event published by one worker doesn't reach subscribers of
+    another; notification long-polls are woken by the database watcher in
+    app/notifications.py instead. A shared backend can be plugged in with ``set_hub`` as long
+    as it provides the same ``publish``/``last_seq``/``wait`` methods.
+    """
+
+    def __init__(self, buffer_size=100, idle_ttl=120):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._buffer_size = buffer_size
+        self._idle_ttl = idle_ttl
+        self._next_prune = 0
+
+    def _channel(self, name):
+        now = time.monotonic()
+        if now >= self._next_prune:
+            self._prune(now)
+        channel = self._channels.get(name)
+        if channel is None:
+            channel = {
+                'condition': threading.Condition(self._lock),
+                'events': deque(maxlen=self._buffer_size),
+                'seq': itertools.count(1),
+                'last_seq': 0,
+                'waiters': 0,
+                'used_at': now
+            }
+            self._channels[name] = channel
+        return channel
+
+    def _prune(self, now):
+        """Drop the channels without waiters that weren't used within ``idle_ttl``"""
+        cutoff = now - self._idle_ttl
+        self._channels = {
+            name: channel for name, channel in self._channels.items()
+            if channel['waiters'] or channel['used_at'] > cutoff
+        }
+        self._next_prune = now + self._idle_ttl
+
+    def publish(self, name, data=None):
+        """Publish an event to a channel and wake its subscribers; returns its sequence"""
+        with self._lock:
+            channel = self._channel(name)
+            seq = next(channel['seq'])
+            channel['events'].append((seq, data))
+            channel['last_seq'] = seq
+            channel['condition'].notify_all()
+            return seq
+
+    def last_seq(self, name):
+        """Sequence of the latest event published to a channel (0 if none)"""
+        with self._lock:
+            channel = self._channels.get(name)
+            return channel['last_seq'] if channel else 0
+
+    def channels(self, prefix=''):
+        """Names of the channels currently known to the hub"""
+        with self._lock:
+            return [name for name in self._channels if name.startswith(prefix)]
+
+    def wait(self, name, after_seq, timeout):
+        """Block until events newer than ``after_seq`` exist on a channel.
+
+        Returns the list of ``(seq, data)`` events newer than ``after_seq`` that
+        are still buffered, or an empty list when the timeout expired.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            channel = self._channel(name)
+            channel['waiters'] += 1
+            channel['used_at'] = time.monotonic()
+            try:
+                while channel['last_seq'] <= after_seq:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return []
+                    channel['condition'].wait(remaining)
+                return [(seq, data) for seq, data in channel['events'] if seq > after_seq]
+            finally:
+                channel['waiters'] -= 1
+                channel['used_at'] = time.monotonic()
+                if not channel['waiters'] and not channel['events']:
+                    self._channels.pop(name, None)
+
+
+_hub = LocalEventHub()
+
+
+def get_hub():
+    """Return the event hub used by the application"""
+    return _hub
+
+
+def set_hub(hub):
+    """Replace the event hub, e.g. with one backed by a shared message broker"""
+    global _hub
+    _hub = hub
+
+
+def publish_after_commit(session, channel, data=None):
+    """Publish an event once the session's current transaction commits.
+
+    Subscribers re-read the database when they are woken, so publishing before
+    the rows are visible would only make them go back to sleep.
+    """
+    session.info.setdefault('pending_events', []).append((channel, data))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending_events(session):
+    for channel, data in session.info.pop('pending_events', []):
+        get_hub().publish(channel, data)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_events(session):
+    session.info.pop('pending_events', None)
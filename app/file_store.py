@@ -0,0 +1,159 @@
+from collections import Counter, namedtuple
+from flask import current_app
+from sqlalchemy import delete, event, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import db
+from models.models import StoredFile
+import hashlib
+import os
+import uuid
+
+# Block size used when copying and hashing files
+BLOCK_SIZE = 64 * 1024
+
+# A file stored for a task or submission: the key of its content and the name
+# it was uploaded under
+AttachedFile = namedtuple('AttachedFile', ['sha256', 'filename'])
+
+
+def object_path(sha256):
+    """Where the content with a given SHA-256 lives, sharded by its first two bytes"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'objects', sha256[:2], sha256[2:4], sha256)
+
+
+def temp_path():
+    """A fresh path for a file being written before it is stored"""
+    directory = os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, uuid.uuid4().hex)
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def store_file(path, sha256=None):
+    """Move a file into the store and take a reference to its content; returns the SHA-256.
+
+    When the content is already stored the file is dropped and the existing copy's
+    reference count goes up instead. The reference is part of the current
+    transaction.
+    """
+    if sha256 is None:
+        sha256 = hash_file(path)
+
+    if _add_references(sha256, 1):
+        os.remove(path)
+        return sha256
+
+    size = os.path.getsize(path)
+    target = object_path(sha256)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredFile(sha256=sha256, size=size, ref_count=1))
+    except IntegrityError:
+        # Stored concurrently by another request, the content is the same
+        _add_references(sha256, 1)
+    return sha256
+
+
+def store_stream(stream):
+    """Copy a readable stream into the store, hashing it on the way; returns the SHA-256"""
+    path = temp_path()
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+            f.write(block)
+            hasher.update(block)
+    return store_file(path, hasher.hexdigest())
+
+
+def _add_references(sha256, count):
+    return StoredFile.query.filter_by(sha256=sha256).update(
+        {StoredFile.ref_count: StoredFile.ref_count + count}, synchronize_session=False
+    )
+
+
+def release(sha256s):
+    """Drop one reference per listed SHA-256; content nobody references anymore is deleted.
+
+    The rows of unreferenced content are deleted when the transaction commits,
+    after the tasks, submissions and uploads that pointed at them were changed
+    or deleted, so the foreign keys hold throughout. The files are then removed
+    from disk by the background worker.
+    """
+    counts = Counter(sha256 for sha256 in sha256s if sha256)
+    if not counts:
+        return
+    for sha256, count in counts.items():
+        _add_references(sha256, -count)
+    db.session.info.setdefault('released_files', set()).update(counts)
+
+
+@event.listens_for(Session, 'before_commit')
+def _delete_unreferenced(session):
+    released = session.info.pop('released_files', None)
+    if not released:
+        return
+    # Write the owners' new references (or their deletion) first
+    session.flush()
+    unreferenced = session.execute(
+        select(StoredFile.sha256).where(StoredFile.sha256.in_(released), StoredFile.ref_count <= 0)
+    ).scalars().all()
+    if unreferenced:
+        session.execute(delete(StoredFile).where(StoredFile.sha256.in_(unreferenced)))
+        _remove_later([object_path(sha256) for sha256 in unreferenced])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_released(session):
+    session.info.pop('released_files', None)
+
+
+def release_attachments(model, *criteria):
+    """Release the files of the tasks or submissions matching ``criteria``.
+
+    Meant to be called right before those rows are deleted, including bulk
+    deletes, in the same transaction. Files uploaded before the store existed are removed directly.
+    """
+    rows = db.session.execute(
+        select(model.file_sha256, model.legacy_file_path).where(
+            *criteria, or_(model.file_sha256.isnot(None), model.legacy_file_path.isnot(None))
+        )
+    ).all()
+    release(sha256 for sha256, _ in rows)
+    _remove_later([path for sha256, path in rows if not sha256 and path])
+
+
+def set_attachment(owner, attached):
+    """Point a task or submission at a newly stored file, releasing its previous one"""
+    if owner.file_sha256:
+        release([owner.file_sha256])
+    elif owner.legacy_file_path:
+        _remove_later([owner.legacy_file_path])
+    owner.file_sha256, owner.file_name = attached if attached else (None, None)
+    owner.legacy_file_path = None
+
+
+def _remove_later(paths):
+    """Have the background worker delete files once the transaction commits"""
+    if paths:
+        from app.jobs import enqueue
+        enqueue('remove_files', {'paths': paths})
+
+
+def remove_unreferenced(paths):
+    """Delete released files from disk, except stored content referenced again since"""
+    restored = set(db.session.execute(
+        select(StoredFile.sha256).where(StoredFile.sha256.in_([os.path.basename(path) for path in paths]))
+    ).scalars())
+    for path in paths:
+        if os.path.basename(path) not in restored and os.path.exists(path):
+            os.remove(path)
@@ -1,9 +1,13 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileSize
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, SelectField, DateTimeField, SelectMultipleField
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, SelectField, DateTimeField, SelectMultipleField, HiddenField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
 from models.models import User, Class, Subject
 
+# Attachments accepted for tasks and submissions, also enforced on chunked uploads
+TASK_FILE_EXTENSIONS = ['pdf', 'doc', 'docx', 'txt', 'jpg', 'jpeg', 'png', 'ppt', 'pptx', 'xls', 'xlsx', 'mp4', 'mov', 'webm']
+SUBMISSION_FILE_EXTENSIONS = ['pdf', 'doc', 'docx', 'txt', 'jpg', 'jpeg', 'png', 'mp4', 'mov', 'webm']
+
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired()])
@@ -62,10 +66,10 @@ class TaskForm(FlaskForm):
     ], validators=[DataRequired()])
     instructions = TextAreaField('Additional Instructions')
     task_file = FileField('Attach File (Optional)', validators=[
-        FileAllowed(['pdf', 'doc', 'docx', 'txt', 'jpg', 'jpeg', 'png', 'ppt', 'pptx', 'xls', 'xlsx'],
-                    'Only document, presentation, and image files allowed!'),
+        FileAllowed(TASK_FILE_EXTENSIONS, 'Only document, presentation, image and video files allowed!'),
         FileSize(max_size=20*1024*1024, message='File size must be less than 20MB!')
     ])
+    upload_id = HiddenField()  # set when the file was sent through the chunked upload API
     assigned_classes = SelectMultipleField('Assign to Classes', choices=[], validators=[], coerce=int)
     assigned_students = SelectMultipleField('Assign to Specific Students (Optional)', choices=[], validators=[], coerce=int)
     assigned_teacher_id = SelectField('Assign to Teacher (Optional - for Admin)', choices=[('', 'None')], coerce=lambda x: int(x) if x else None)
@@ -78,9 +82,10 @@ class AssignmentForm(FlaskForm):
 class SubmissionForm(FlaskForm):
     content = TextAreaField('Submission Content')
     file = FileField('Upload File (optional)', validators=[
-        FileAllowed(['pdf', 'doc', 'docx', 'txt', 'jpg', 'jpeg', 'png'], 'Only document and image files allowed!'),
+        FileAllowed(SUBMISSION_FILE_EXTENSIONS, 'Only document, image and video files allowed!'),
         FileSize(max_size=10*1024*1024, message='File size must be less than 10MB!')
     ])
+    upload_id = HiddenField()  # set when the file was sent through the chunked upload API
     submit = SubmitField('Submit Work')
 
 class AdminUserForm(FlaskForm):
@@ -1,47 +1,156 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
+from sqlalchemy import and_, or_, select, union
+from sqlalchemy.orm import contains_eager
 from app import db
-from models.models import ChatRoom, ChatMessage, User, Class
-from datetime import datetime, timedelta
+from app.events import get_hub, publish_after_commit
+from app.forum_access import can_access_class_forum, can_access_room
+from app.presence import online_user_ids, touch
+from models.models import ChatRoom, ChatMessage, User, Class, teacher_class_subjects, teacher_classes
+from collections import namedtuple
+import json
 
 forum = Blueprint('forum', __name__)
 
+# Messages per page of the forum API and the admin view, and the hard cap on ?limit=
+FORUM_PAGE_SIZE = 50
+FORUM_MAX_PAGE_SIZE = 100
+
+
+# A row of a forum member list
+ForumMember = namedtuple('ForumMember', ['id', 'name', 'user_type', 'subject', 'is_active_forum'])
+
+
+def _members(query):
+    """Load member rows and mark the ones currently present, active members first"""
+    rows = db.session.execute(query.order_by(User.name)).all()
+    online = online_user_ids([row.id for row in rows])
+    members = [ForumMember(row.id, row.name, row.user_type, row.subject, row.id in online) for row in rows]
+    return sorted(members, key=lambda member: not member.is_active_forum)
+
 
 def get_class_members(class_id):
     """Get all members (students and teachers) of a class with their activity status"""
-    class_obj = Class.query.get(class_id)
-    if not class_obj:
-        return [], []
-    
-    # Get students in the class
-    students = User.query.filter_by(class_id=class_id, user_type='student').all()
-    
-    # Get teachers teaching this class
-    teachers = list(class_obj.teachers)
-    
-    # Determine active status (active if logged in within last 5 minutes)
-    active_time = datetime.utcnow() - timedelta(minutes=5)
-    
-    for student in students:
-        student.is_active_forum = student.created_at >= active_time
-    
-    for teacher in teachers:
-        teacher.is_active_forum = teacher.created_at >= active_time
+    taught = union(
+        select(teacher_classes.c.teacher_id).where(teacher_classes.c.class_id == class_id),
+        select(teacher_class_subjects.c.teacher_id).where(teacher_class_subjects.c.class_id == class_id)
+    )
+    members = _members(select(User.id, User.name, User.user_type, User.subject).where(or_(
+        and_(User.user_type == 'student', User.class_id == class_id),
+        and_(User.user_type == 'teacher', User.id.in_(taught))
+    )))
     
+    students = [member for member in members if member.user_type == 'student']
+    teachers = [member for member in members if member.user_type == 'teacher']
     return students, teachers
 
 
 def get_teacher_forum_members():
     """Get all teachers with their activity status"""
-    teachers = User.query.filter_by(user_type='teacher').all()
-    
-    # Determine active status
-    active_time = datetime.utcnow() - timedelta(minutes=5)
+    return _members(select(User.id, User.name, User.user_type, User.subject).where(User.user_type == 'teacher'))
+
+
+def get_message_page(room_id, before=None, after=None, limit=FORUM_PAGE_SIZE):
+    """Keyset-paginate the messages of a room by id.
+
+    Returns the newest page by default, the page just older than ``before`` or the
+    page just newer than ``after``, oldest first, with authors loaded by the same
+    query. The returned cursors hold the id to pass as ``before`` to page back
+    (None when there are no older messages) and as ``after`` to page forward or
+    fetch new messages incrementally, plus whether newer messages already exist.
+    """
+    limit = max(1, min(limit, FORUM_MAX_PAGE_SIZE))
+    query = ChatMessage.query.join(ChatMessage.user).options(
+        contains_eager(ChatMessage.user)
+    ).filter(
+        ChatMessage.room_id == room_id,
+        ChatMessage.is_deleted == False
+    )
+
+    def exists(criterion):
+        return db.session.query(query.filter(criterion).exists()).scalar()
+
+    if after is not None:
+        messages = query.filter(ChatMessage.id > after).order_by(
+            ChatMessage.id.asc()
+        ).limit(limit + 1).all()
+        has_next = len(messages) > limit
+        messages = messages[:limit]
+        has_prev = exists(ChatMessage.id <= after) if messages else after > 0
+    else:
+        if before is not None:
+            query_page = query.filter(ChatMessage.id < before)
+        else:
+            query_page = query
+        messages = query_page.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+        has_prev = len(messages) > limit
+        messages = list(reversed(messages[:limit]))
+        has_next = before is not None and exists(ChatMessage.id >= before)
+
+    if messages:
+        next_cursor = messages[-1].id
+    elif before is not None:
+        next_cursor = before - 1
+    else:
+        next_cursor = after or 0
+
+    cursors = {
+        'prev_cursor': messages[0].id if messages and has_prev else None,
+        'next_cursor': next_cursor,
+        'has_next': has_next
+    }
+    return messages, cursors
+
+def serialize_message(message):
+    """JSON representation of a message for the API and the live stream"""
+    return {
+        'id': message.id,
+        'room_id': message.room_id,
+        'user_id': message.user_id,
+        'user_name': message.user.name,
+        'content': message.content,
+        'created_at': message.created_at.isoformat()
+    }
+
+
+def publish_message_event(message, event_type):
+    """Send a 'new', 'edited' or 'deleted' event to the room's subscribers.
+
+    The event goes out once the current transaction commits, so ``message`` must
+    already have been flushed to have an id.
+    """
+    if event_type == 'deleted':
+        data = {'id': message.id, 'room_id': message.room_id}
+    else:
+        data = serialize_message(message)
+    publish_after_commit(db.session, ChatRoom.channel(message.room_id), {'type': event_type, 'message': data})
+
+
+def wants_json():
+    """Whether the request was sent by the forum page script rather than a form"""
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def post_message(room, content):
+    """Create a message, notify the room and answer as JSON or with a redirect"""
+    message = ChatMessage(
+        room_id=room.id,
+        user_id=current_user.id,
+        content=content
+    )
+    db.session.add(message)
+    db.session.flush()
+    publish_message_event(message, 'new')
+    db.session.commit()
     
-    for teacher in teachers:
-        teacher.is_active_forum = teacher.created_at >= active_time
+    if wants_json():
+        return jsonify(serialize_message(message)), 201
     
-    return teachers
+    flash('Message posted successfully!', 'success')
+    if room.room_type == 'class':
+        return redirect(url_for('forum.class_forum', class_id=room.class_id))
+    return redirect(url_for('forum.teachers_forum'))
+
 
 # ============================================
 # STUDENT FORUM ROUTES
@@ -54,32 +163,21 @@ def class_forum(class_id):
     # Get the class
     class_obj = Class.query.get_or_404(class_id)
     
-    # Check if user is a student in this class
-    if current_user.user_type == 'student':
-        if current_user.class_id != class_id:
+    # Students can access their own class forum, teachers the classes they teach
+    if not can_access_class_forum(current_user, class_id):
+        if current_user.user_type == 'student':
             flash('You can only access your own class forum.', 'danger')
-            return redirect(url_for('main.dashboard'))
-    elif current_user.user_type == 'teacher':
-        # Teachers can access class forums for classes they teach
-        teacher_classes = db.session.query(Class).join(
-            'teachers'
-        ).filter(User.id == current_user.id).all()
-        if class_obj not in teacher_classes and class_obj not in current_user.teaching_classes:
+        elif current_user.user_type == 'teacher':
             flash('You can only access forums for classes you teach.', 'danger')
-            return redirect(url_for('main.dashboard'))
-    elif current_user.user_type != 'admin':
-        flash('Access denied.', 'danger')
+        else:
+            flash('Access denied.', 'danger')
         return redirect(url_for('main.dashboard'))
     
     # Get or create the chat room
     room = ChatRoom.get_or_create_class_room(class_id, current_user.id)
     
     # Get messages (most recent first)
-    messages = ChatMessage.query.filter_by(
-        room_id=room.id, 
-        is_deleted=False
-    ).order_by(ChatMessage.created_at.desc()).limit(100).all()
-    messages = list(reversed(messages))
+    messages, _ = get_message_page(room.id, limit=FORUM_MAX_PAGE_SIZE)
     
     # Get class members
     students, teachers = get_class_members(class_id)
@@ -102,19 +200,16 @@ def post_class_message(class_id):
     class_obj = Class.query.get_or_404(class_id)
     
     # Check if user can post
-    if current_user.user_type == 'student':
-        if current_user.class_id != class_id:
+    if not can_access_class_forum(current_user, class_id):
+        if wants_json():
+            return jsonify({'error': 'Access denied'}), 403
+        if current_user.user_type == 'student':
             flash('You can only post in your own class forum.', 'danger')
             return redirect(url_for('forum.class_forum', class_id=class_id))
-    elif current_user.user_type == 'teacher':
-        teacher_classes = db.session.query(Class).join(
-            'teachers'
-        ).filter(User.id == current_user.id).all()
-        if class_obj not in teacher_classes and class_obj not in current_user.teaching_classes:
+        elif current_user.user_type == 'teacher':
             flash('You can only post in forums for classes you teach.', 'danger')
-            return redirect(url_for('main.dashboard'))
-    elif current_user.user_type != 'admin':
-        flash('Access denied.', 'danger')
+        else:
+            flash('Access denied.', 'danger')
         return redirect(url_for('main.dashboard'))
     
     # Get or create the chat room
@@ -123,20 +218,12 @@ def post_class_message(class_id):
     # Get message content
     content = request.form.get('content', '').strip()
     if not content:
+        if wants_json():
+            return jsonify({'error': 'Message cannot be empty.'}), 400
         flash('Message cannot be empty.', 'danger')
         return redirect(url_for('forum.class_forum', class_id=class_id))
     
-    # Create the message
-    message = ChatMessage(
-        room_id=room.id,
-        user_id=current_user.id,
-        content=content
-    )
-    db.session.add(message)
-    db.session.commit()
-    
-    flash('Message posted successfully!', 'success')
-    return redirect(url_for('forum.class_forum', class_id=class_id))
+    return post_message(room, content)
 
 
 # ============================================
@@ -155,11 +242,7 @@ def teachers_forum():
     room = ChatRoom.get_or_create_teacher_room(current_user.id)
     
     # Get messages (most recent first)
-    messages = ChatMessage.query.filter_by(
-        room_id=room.id, 
-        is_deleted=False
-    ).order_by(ChatMessage.created_at.desc()).limit(100).all()
-    messages = list(reversed(messages))
+    messages, _ = get_message_page(room.id, limit=FORUM_MAX_PAGE_SIZE)
     
     # Get all teachers
     teachers = get_teacher_forum_members()
@@ -186,20 +269,12 @@ def post_teacher_message():
     # Get message content
     content = request.form.get('content', '').strip()
     if not content:
+        if wants_json():
+            return jsonify({'error': 'Message cannot be empty.'}), 400
         flash('Message cannot be empty.', 'danger')
         return redirect(url_for('forum.teachers_forum'))
     
-    # Create the message
-    message = ChatMessage(
-        room_id=room.id,
-        user_id=current_user.id,
-        content=content
-    )
-    db.session.add(message)
-    db.session.commit()
-    
-    flash('Message posted successfully!', 'success')
-    return redirect(url_for('forum.teachers_forum'))
+    return post_message(room, content)
 
 
 # ============================================
@@ -234,16 +309,19 @@ def admin_view_forum(room_id):
         return redirect(url_for('main.dashboard'))
     
     room = ChatRoom.query.get_or_404(room_id)
-    messages = ChatMessage.query.filter_by(
-        room_id=room.id,
-        is_deleted=False
-    ).order_by(ChatMessage.created_at.desc()).all()
-    messages = list(reversed(messages))
+    messages, cursors = get_message_page(
+        room.id,
+        before=request.args.get('before', type=int),
+        after=request.args.get('after', type=int)
+    )
+    message_count = ChatMessage.query.filter_by(room_id=room.id, is_deleted=False).count()
     
     return render_template(
         'admin_view_forum.html',
         room=room,
-        messages=messages
+        messages=messages,
+        cursors=cursors,
+        message_count=message_count
     )
 
 
@@ -257,6 +335,7 @@ def admin_delete_message(message_id):
     
     message = ChatMessage.query.get_or_404(message_id)
     message.is_deleted = True
+    publish_message_event(message, 'deleted')
     db.session.commit()
     
     flash('Message deleted.', 'success')
@@ -285,42 +364,119 @@ def my_class_forum():
 @forum.route('/api/forum/<int:room_id>/messages')
 @login_required
 def api_get_messages(room_id):
-    """API endpoint to get messages for a room (for potential real-time updates)"""
+    """API endpoint to get a page of messages for a room (for real-time updates and scrolling)"""
     room = ChatRoom.query.get_or_404(room_id)
     
-    # Check access
-    if room.room_type == 'class':
-        class_obj = room.class_group
-        if current_user.user_type == 'student':
-            if current_user.class_id != class_obj.id:
-                return jsonify({'error': 'Access denied'}), 403
-        elif current_user.user_type == 'teacher':
-            teacher_classes = db.session.query(Class).join(
-                'teachers'
-            ).filter(User.id == current_user.id).all()
-            if class_obj not in teacher_classes and class_obj not in current_user.teaching_classes:
-                return jsonify({'error': 'Access denied'}), 403
-        elif current_user.user_type != 'admin':
-            return jsonify({'error': 'Access denied'}), 403
-    elif room.room_type == 'teacher':
-        if current_user.user_type not in ['teacher', 'admin']:
-            return jsonify({'error': 'Access denied'}), 403
+    if not can_access_room(current_user, room):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Get one page of messages; ?after= (or the older ?last_id=) fetches newer
+    # messages incrementally, ?before= pages back through the history
+    after = request.args.get('after', request.args.get('last_id', type=int), type=int)
+    messages, cursors = get_message_page(
+        room.id,
+        before=request.args.get('before', type=int),
+        after=after,
+        limit=request.args.get('limit', FORUM_PAGE_SIZE, type=int)
+    )
     
-    # Get messages
-    last_id = request.args.get('last_id', 0, type=int)
-    messages = ChatMessage.query.filter(
-        ChatMessage.room_id == room.id,
-        ChatMessage.is_deleted == False,
-        ChatMessage.id > last_id
-    ).order_by(ChatMessage.created_at.asc()).all()
+    return jsonify({
+        'messages': [serialize_message(m) for m in messages],
+        **cursors
+    })
+
+
+def format_event(event_type, data, event_id=None):
+    """Format one server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+@forum.route('/api/forum/<int:room_id>/stream')
+@login_required
+def stream_messages(room_id):
+    """Server-sent event stream of a room's new, edited and deleted messages.
+
+    Clients resume from the last message id they have (``?after=`` or the
+    ``Last-Event-ID`` header sent by EventSource on reconnect) and get the
+    messages they missed before the live events. Waiting happens on the event
+    hub without a database connection, so under gevent workers an idle
+    subscriber costs a greenlet rather than a thread.
+
+    The hub only wakes streams of the worker a message was posted through, so
+    on every keepalive the stream also fetches messages newer than the last one
+    it sent, and ends once the user may no longer read the room. Edits and
+    deletions made through other workers show on the next page load.
+    """
+    room = ChatRoom.query.get_or_404(room_id)
+    
+    if not can_access_room(current_user, room):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    hub = get_hub()
+    channel = ChatRoom.channel(room.id)
+    seq = hub.last_seq(channel)
     
-    return jsonify([{
-        'id': m.id,
-        'user_id': m.user_id,
-        'user_name': m.user.name,
-        'content': m.content,
-        'created_at': m.created_at.isoformat()
-    } for m in messages])
+    after = request.headers.get('Last-Event-ID', request.args.get('after', type=int), type=int)
+    missed = []
+    if after is not None:
+        messages, cursors = get_message_page(room.id, after=after, limit=FORUM_MAX_PAGE_SIZE)
+        missed = [serialize_message(m) for m in messages]
+        last_id = cursors['next_cursor']
+    else:
+        last_id = db.session.query(db.func.max(ChatMessage.id)).filter(ChatMessage.room_id == room.id).scalar() or 0
+    
+    # Give the connection back to the pool for the lifetime of the stream
+    db.session.close()
+    app = current_app._get_current_object()
+    keepalive = current_app.config['FORUM_STREAM_KEEPALIVE']
+    user_id = current_user.id
+    
+    def catch_up(last_id):
+        """Messages newer than ``last_id``, or None when the user lost access to the room"""
+        with app.app_context():
+            # Users with a forum open stay present
+            touch(user_id)
+            user = db.session.get(User, user_id)
+            # Straight from the database, the cached access may be stale and is
+            # left alone for the user's other requests
+            if user is None or not can_access_room(user, room, cached=False):
+                return None
+            messages, _ = get_message_page(room.id, after=last_id, limit=FORUM_MAX_PAGE_SIZE)
+            return [serialize_message(m) for m in messages]
+    
+    def generate(seq, last_id):
+        yield 'retry: 3000\n\n'
+        for message in missed:
+            yield format_event('new', message, message['id'])
+        while True:
+            events = hub.wait(channel, seq, keepalive)
+            if not events:
+                messages = catch_up(last_id)
+                if messages is None:
+                    return
+                for message in messages:
+                    last_id = message['id']
+                    yield format_event('new', message, message['id'])
+                yield ': keepalive\n\n'
+                continue
+            for seq, data in events:
+                message = data['message']
+                if data['type'] == 'new':
+                    if message['id'] <= last_id:
+                        continue  # already sent by a catch-up
+                    last_id = message['id']
+                event_id = message['id'] if data['type'] == 'new' else None
+                yield format_event(data['type'], message, event_id)
+    
+    response = current_app.response_class(generate(seq, last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # ============================================
@@ -332,22 +488,8 @@ def get_room_and_verify_access(message_id):
     message = ChatMessage.query.get_or_404(message_id)
     room = message.room
     
-    if room.room_type == 'class':
-        class_obj = room.class_group
-        if current_user.user_type == 'student':
-            if current_user.class_id != class_obj.id:
-                return None, None, False
-        elif current_user.user_type == 'teacher':
-            teacher_classes = db.session.query(Class).join(
-                'teachers'
-            ).filter(User.id == current_user.id).all()
-            if class_obj not in teacher_classes and class_obj not in current_user.teaching_classes:
-                return None, None, False
-        elif current_user.user_type != 'admin':
-            return None, None, False
-    elif room.room_type == 'teacher':
-        if current_user.user_type not in ['teacher', 'admin']:
-            return None, None, False
+    if not can_access_room(current_user, room):
+        return None, None, False
     
     # Check if user owns the message or is admin
     if message.user_id != current_user.id and current_user.user_type != 'admin':
@@ -377,6 +519,7 @@ def edit_message(message_id):
             flash('Message cannot be empty.', 'danger')
         else:
             message.content = content
+            publish_message_event(message, 'edited')
             db.session.commit()
             flash('Message updated successfully!', 'success')
             
@@ -405,6 +548,7 @@ def delete_message(message_id):
     
     # Soft delete the message
     message.is_deleted = True
+    publish_message_event(message, 'deleted')
     db.session.commit()
     
     flash('Message deleted.', 'success')
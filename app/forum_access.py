@@ -0,0 +1,82 @@
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import select, union
+from app import db
+from app.cache import TTLCache
+from models.models import teacher_class_subjects, teacher_classes
+
+# What a user may read and post in: the class forums of ``class_ids`` and,
+# with ``teacher_room``, the institution-wide teachers forum
+ForumAccess = namedtuple('ForumAccess', ['class_ids', 'teacher_room'])
+
+_cache = None
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(current_app.config['FORUM_ACCESS_CACHE_TTL'], maxsize=10000)
+    return _cache
+
+
+def _load_access(user):
+    if user.user_type == 'student':
+        class_ids = frozenset([user.class_id]) if user.class_id else frozenset()
+        return ForumAccess(class_ids, False)
+    if user.user_type == 'teacher':
+        # Classes the teacher teaches through either mapping, in one query
+        taught = union(
+            select(teacher_classes.c.class_id).where(teacher_classes.c.teacher_id == user.id),
+            select(teacher_class_subjects.c.class_id).where(teacher_class_subjects.c.teacher_id == user.id)
+        )
+        class_ids = frozenset(db.session.execute(taught).scalars())
+        return ForumAccess(class_ids, True)
+    return ForumAccess(frozenset(), False)
+
+
+def get_forum_access(user, cached=True):
+    """Return the cached ``ForumAccess`` of a user, loading it on a miss.
+
+    With ``cached=False`` it is loaded from the database and the cache is left as is.
+    """
+    if not cached:
+        return _load_access(user)
+    cache = _get_cache()
+    access = cache.get(user.id)
+    if access is None:
+        access = cache.set(user.id, _load_access(user))
+    return access
+
+
+def can_access_class_forum(user, class_id, cached=True):
+    """Whether a user may read and post in the forum of a class"""
+    if user.user_type == 'admin':
+        return True
+    return class_id in get_forum_access(user, cached).class_ids
+
+
+def can_access_teacher_forum(user, cached=True):
+    """Whether a user may read and post in the teachers forum"""
+    return user.user_type == 'admin' or get_forum_access(user, cached).teacher_room
+
+
+def can_access_room(user, room, cached=True):
+    """Whether a user may read and post in a chat room"""
+    if room.room_type == 'class':
+        return can_access_class_forum(user, room.class_id, cached)
+    elif room.room_type == 'teacher':
+        return can_access_teacher_forum(user, cached)
+    return True
+
+
+def invalidate_forum_access(user_id=None):
+    """Drop the cached access of a user, or of everyone when ``user_id`` is None.
+
+    Call it after changing a user's type or class, or the classes a teacher teaches.
+    """
+    if _cache is None:
+        return
+    if user_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(user_id)
@@ -0,0 +1,255 @@
+from datetime import datetime, timedelta
+from flask import current_app, g, has_request_context
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models.models import Job
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Handlers by job name, registered with @job
+_handlers = {}
+
+
+def job(name):
+    """Register a function as the handler of a job name.
+
+    Handlers receive the job payload as keyword arguments and run in the same
+    transaction that marks the job as succeeded, so their database writes
+    happen exactly once. Other side effects (files) may be retried and must be
+    safe to repeat.
+    """
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """Queue a job in the current transaction; returns the Job.
+
+    The job only becomes visible to workers when the caller commits, so it never
+    runs against rows that were rolled back. With an idempotency ``key`` the
+    existing job with that key is returned instead of queueing another one.
+    """
+    if name not in _handlers:
+        raise ValueError(f'Unknown job: {name}')
+
+    if key is not None:
+        existing = Job.query.filter_by(idempotency_key=key).first()
+        if existing:
+            return existing
+
+    new_job = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        idempotency_key=key,
+        status='queued',
+        attempts=0,
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(new_job)
+    except IntegrityError:
+        # Queued concurrently under the same key
+        return Job.query.filter_by(idempotency_key=key).one()
+    if has_request_context():
+        g.jobs_queued = True
+    return new_job
+
+
+def _claimable(now):
+    """Jobs due to run, and running jobs whose worker stopped answering"""
+    stale = now - timedelta(seconds=current_app.config['JOB_LOCK_TIMEOUT'])
+    return or_(
+        and_(Job.status == 'queued', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_at < stale)
+    )
+
+
+def claim_next(worker_id):
+    """Lock the next due job for a worker; returns it or None.
+
+    The claim is a conditional UPDATE, so when several workers pick the same
+    job only one of them gets it, on SQLite as well as PostgreSQL.
+    """
+    now = datetime.utcnow()
+    candidates = db.session.query(Job.id).filter(_claimable(now)).order_by(Job.run_at, Job.id).limit(5).all()
+    for job_id, in candidates:
+        claimed = Job.query.filter(Job.id == job_id, _claimable(now)).update({
+            'status': 'running',
+            'locked_by': worker_id,
+            'locked_at': now,
+            'attempts': Job.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+
+def run_job(claimed):
+    """Run a claimed job, then mark it succeeded or schedule its retry.
+
+    The outcome is only recorded while the worker still holds the lock. A job
+    that ran past ``JOB_LOCK_TIMEOUT`` and was reclaimed by another worker has
+    its late result rolled back, so handlers' writes still happen once.
+    """
+    job_id = claimed.id
+    worker_id = claimed.locked_by
+    owned = and_(Job.id == job_id, Job.status == 'running', Job.locked_by == worker_id)
+    try:
+        handler = _handlers.get(claimed.name)
+        if handler is None:
+            raise LookupError(f'No handler registered for job {claimed.name!r}')
+        handler(**json.loads(claimed.payload))
+        succeeded = Job.query.filter(owned).update({
+            'status': 'succeeded',
+            'finished_at': datetime.utcnow(),
+            'last_error': None
+        }, synchronize_session=False)
+        if not succeeded:
+            db.session.rollback()
+            logger.warning('Job %s was reclaimed by another worker, discarding the result of %s', job_id, worker_id)
+            return False
+        db.session.commit()
+        return True
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc(limit=5)
+        logger.warning('Job %s failed:\n%s', job_id, error)
+
+        failed = Job.query.filter(owned).first()
+        if failed is None:
+            return False  # reclaimed by another worker, which records the outcome
+        failed.last_error = error
+        failed.locked_by = None
+        failed.locked_at = None
+        if failed.attempts >= failed.max_attempts:
+            failed.status = 'failed'
+            failed.finished_at = datetime.utcnow()
+        else:
+            # Exponential backoff: 1x, 2x, 4x... the base delay
+            delay = current_app.config['JOB_RETRY_DELAY'] * 2 ** (failed.attempts - 1)
+            failed.status = 'queued'
+            failed.run_at = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+        return False
+
+
+def retry_job(job_id):
+    """Queue a failed job again with a fresh set of attempts"""
+    return Job.query.filter_by(id=job_id, status='failed').update({
+        'status': 'queued',
+        'attempts': 0,
+        'run_at': datetime.utcnow(),
+        'finished_at': None
+    }, synchronize_session=False)
+
+
+def purge_finished_jobs(days=None):
+    """Delete succeeded jobs finished more than ``days`` ago; returns how many"""
+    days = current_app.config['JOB_RETENTION_DAYS'] if days is None else days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = Job.query.filter(Job.status == 'succeeded', Job.finished_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def job_counts():
+    """Number of jobs in each status"""
+    counts = dict.fromkeys(Job.STATUSES, 0)
+    counts.update(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all())
+    return counts
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def work(worker_id=None, once=False, poll_interval=None, stop=None):
+    """Run queued jobs until ``stop`` is set; with ``once`` until the queue is empty.
+
+    Returns the number of jobs run. A long-running worker purges finished jobs
+    past their retention about once an hour.
+    """
+    worker_id = worker_id or default_worker_id()
+    poll_interval = current_app.config['JOB_POLL_INTERVAL'] if poll_interval is None else poll_interval
+    stop = stop or threading.Event()
+    processed = 0
+    next_purge = 0
+
+    while not stop.is_set():
+        if not once and time.monotonic() >= next_purge:
+            purge_finished_jobs()
+            next_purge = time.monotonic() + 3600
+
+        claimed = claim_next(worker_id)
+        if claimed is None:
+            db.session.remove()
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+
+        run_job(claimed)
+        processed += 1
+        db.session.remove()
+    return processed
+
+
+def init_app(app):
+    """With ``JOB_RUN_INLINE``, run the jobs a request queued once its response is sent.
+
+    For deployments without a worker process (a single web service, serverless
+    functions). The jobs run when the server closes the response, so the client
+    doesn't wait for them, though the web worker is busy until they are done.
+    Retries are picked up by the next request that queues a job or by
+    ``run_worker.py --once`` from a scheduler.
+    """
+    def run_queued_jobs():
+        try:
+            with app.app_context():
+                work(once=True)
+        except Exception:
+            logger.exception('Running queued jobs inline failed')
+
+    @app.after_request
+    def _run_queued_jobs_after_response(response):
+        if app.config['JOB_RUN_INLINE'] and g.pop('jobs_queued', False):
+            response.call_on_close(run_queued_jobs)
+        return response
+
+
+def start_worker_thread(app):
+    """Run a worker in a daemon thread of this process, for local development"""
+    def target():
+        with app.app_context():
+            work(worker_id=default_worker_id())
+
+    thread = threading.Thread(target=target, name='job-worker', daemon=True)
+    thread.start()
+    return thread
+
+
+# Handlers
+
+@job('create_notifications')
+def _create_notifications(user_ids, title, message, notification_type='info', expires_in_hours=None):
+    from models.models import Notification
+    Notification.create_notifications(user_ids, title, message, notification_type, expires_in_hours, commit=False)
+
+
+@job('remove_files')
+def _remove_files(paths):
+    from app.file_store import remove_unreferenced
+    remove_unreferenced(paths)
@@ -1,11 +1,114 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, current_app
 from flask_login import login_required, current_user
-from models.models import Notification
+from sqlalchemy import DateTime, Integer, and_, func, literal, or_, select, union_all
+from models.models import Notification, Broadcast, BroadcastReceipt
 from app import db
+from app.events import get_hub
+from app.jobs import enqueue
 from datetime import datetime, timedelta
+import logging
+import threading
+import time
 
 notifications = Blueprint('notifications', __name__)
 
+logger = logging.getLogger(__name__)
+
+class InboxItem:
+    """A personal notification or a broadcast as listed in a user's inbox"""
+    
+    def __init__(self, row):
+        self.__dict__.update(row._mapping)
+    
+    def is_expired(self):
+        if self.expires_at is None:
+            return False
+        return datetime.utcnow() > self.expires_at
+
+def _serialize(item):
+    """JSON representation of an inbox item for the API"""
+    return {
+        'id': item.id,
+        'kind': item.kind,
+        'title': item.title,
+        'message': item.message,
+        'type': item.notification_type,
+        'is_read': item.is_read,
+        'created_at': item.created_at.isoformat(),
+        'expires_at': item.expires_at.isoformat() if item.expires_at else None,
+        'is_expired': item.is_expired()
+    }
+
+def _unexpired(model):
+    return or_(model.expires_at.is_(None), model.expires_at > datetime.utcnow())
+
+def _visible_notifications(user_id, include_read=False):
+    """Query for a user's personal notifications that haven't expired"""
+    query = Notification.query.filter_by(user_id=user_id).filter(_unexpired(Notification))
+    
+    if not include_read:
+        query = query.filter_by(is_read=False)
+    
+    return query
+
+def _visible_broadcasts(user, include_read=False):
+    """Select of the unexpired broadcasts a user receives, with whether they read them"""
+    receipt = and_(
+        BroadcastReceipt.broadcast_id == Broadcast.id,
+        BroadcastReceipt.user_id == user.id
+    )
+    stmt = db.select(
+        literal('broadcast').label('kind'),
+        Broadcast.id,
+        Broadcast.title,
+        Broadcast.message,
+        Broadcast.notification_type,
+        BroadcastReceipt.user_id.isnot(None).label('is_read'),
+        Broadcast.created_at,
+        Broadcast.expires_at
+    ).outerjoin(BroadcastReceipt, receipt).where(*Broadcast.visible_to(user), _unexpired(Broadcast))
+    
+    if not include_read:
+        stmt = stmt.where(BroadcastReceipt.user_id.is_(None))
+    
+    return stmt
+
+def _inbox(user, include_read=False, since=0, since_broadcast=0, limit=None):
+    """A user's personal notifications and broadcasts, newest first, in one UNION ALL query"""
+    personal = db.select(
+        literal('personal').label('kind'),
+        Notification.id,
+        Notification.title,
+        Notification.message,
+        Notification.notification_type,
+        Notification.is_read,
+        Notification.created_at,
+        Notification.expires_at
+    ).where(Notification.user_id == user.id, _unexpired(Notification))
+    if not include_read:
+        personal = personal.where(Notification.is_read == False)
+    if since:
+        personal = personal.where(Notification.id > since)
+    
+    broadcasts = _visible_broadcasts(user, include_read)
+    if since_broadcast:
+        broadcasts = broadcasts.where(Broadcast.id > since_broadcast)
+    
+    inbox = union_all(personal, broadcasts).subquery()
+    stmt = db.select(inbox).order_by(inbox.c.created_at.desc(), inbox.c.id.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    
+    return [InboxItem(row) for row in db.session.execute(stmt)]
+
+def _inbox_response(items, since=0, since_broadcast=0):
+    """JSON body listing inbox items and the newest ids seen of each kind"""
+    return {
+        'notifications': [_serialize(item) for item in items],
+        'last_id': max((item.id for item in items if item.kind == 'personal'), default=since),
+        'last_broadcast_id': max((item.id for item in items if item.kind == 'broadcast'), default=since_broadcast)
+    }
+
 @notifications.route('/api/notifications')
 @login_required
 def get_notifications():
@@ -13,31 +116,115 @@ def get_notifications():
     limit = request.args.get('limit', 10, type=int)
     include_read = request.args.get('include_read', False, type=bool)
     
-    query = Notification.query.filter_by(user_id=current_user.id)
+    items = _inbox(current_user, include_read, limit=limit)
     
-    # Filter out expired notifications
-    query = query.filter(
-        (Notification.expires_at.is_(None)) | 
-        (Notification.expires_at > datetime.utcnow())
-    )
+    return jsonify(_inbox_response(items))
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def _latest_ids():
+    return db.session.execute(select(
+        select(func.max(Notification.id)).scalar_subquery(),
+        select(func.max(Broadcast.id)).scalar_subquery()
+    )).one()
+
+
+def start_notification_watcher(app):
+    """Start this process's notification watcher unless it is running or disabled"""
+    global _watcher
+    if _watcher is not None or app.config['NOTIFICATION_WATCH_INTERVAL'] <= 0:
+        return
+    with _watcher_lock:
+        if _watcher is None:
+            # Read the starting point now, so nothing written after this request's
+            # own check is missed
+            last_ids = _latest_ids()
+            _watcher = threading.Thread(
+                target=_watch_notifications, args=(app, last_ids), name='notification-watcher', daemon=True
+            )
+            _watcher.start()
+
+
+def _watch_notifications(app, last_ids):
+    """Wake this process's long-polls for notifications written by other processes.
+
+    Notifications created by the job worker or by another web worker are only
+    published to the event hub of the process that wrote them. Every
+    NOTIFICATION_WATCH_INTERVAL seconds the watcher reads the newest notification
+    and broadcast ids, one query for the whole process, and when they moved it
+    wakes the local channels of the users concerned (every user for a broadcast).
+    """
+    hub = get_hub()
+    last_notification, last_broadcast = (value or 0 for value in last_ids)
+    while True:
+        time.sleep(app.config['NOTIFICATION_WATCH_INTERVAL'])
+        try:
+            with app.app_context():
+                newest_notification, newest_broadcast = (value or 0 for value in _latest_ids())
+                waiting = set(hub.channels('user:'))
+                if waiting and newest_broadcast > last_broadcast:
+                    channels = waiting
+                elif waiting and newest_notification > last_notification:
+                    user_ids = db.session.execute(
+                        select(Notification.user_id).distinct().where(
+                            Notification.id > last_notification, Notification.id <= newest_notification
+                        )
+                    ).scalars()
+                    channels = waiting.intersection(Notification.channel(user_id) for user_id in user_ids)
+                else:
+                    channels = ()
+                last_notification, last_broadcast = newest_notification, newest_broadcast
+            for channel in channels:
+                hub.publish(channel)
+        except Exception:
+            logger.exception('Notification watcher failed')
+
+
+@notifications.route('/api/notifications/poll')
+@login_required
+def poll_notifications():
+    """Long-poll for unread notifications newer than the ``since`` ids.
+
+    ``since`` is the last personal notification id and ``since_broadcast`` the
+    last broadcast id the client has seen. Answers right away when there already
+    are newer ones, otherwise holds the request until a notification is written
+    for the user (or the timeout expires) and returns 304 Not Modified when
+    nothing changed, so clients can poll again.
+    """
+    user = current_user._get_current_object()
+    since = request.args.get('since', 0, type=int)
+    since_broadcast = request.args.get('since_broadcast', 0, type=int)
+    limit = request.args.get('limit', 5, type=int)
+    max_timeout = current_app.config['NOTIFICATION_POLL_TIMEOUT']
+    timeout = max(0, min(request.args.get('timeout', max_timeout, type=float), max_timeout))
     
-    if not include_read:
-        query = query.filter_by(is_read=False)
+    hub = get_hub()
+    channel = Notification.channel(user.id)
+    seq = hub.last_seq(channel)
+    start_notification_watcher(current_app._get_current_object())
     
-    notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
+    def newer_exists():
+        return bool(_inbox(user, since=since, since_broadcast=since_broadcast, limit=1))
     
-    return jsonify({
-        'notifications': [{
-            'id': n.id,
-            'title': n.title,
-            'message': n.message,
-            'type': n.notification_type,
-            'is_read': n.is_read,
-            'created_at': n.created_at.isoformat(),
-            'expires_at': n.expires_at.isoformat() if n.expires_at else None,
-            'is_expired': n.is_expired()
-        } for n in notifications]
-    })
+    if not newer_exists():
+        # Give the connection back to the pool while waiting. Notifications written
+        # by other processes wake it through the watcher within a second; check
+        # again after the wait even when it timed out, in case the watcher is off.
+        db.session.close()
+        if timeout:
+            hub.wait(channel, seq, timeout)
+        if not newer_exists():
+            response = current_app.response_class(status=304)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+    
+    items = _inbox(user, limit=limit)
+    
+    response = jsonify(_inbox_response(items, since, since_broadcast))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @notifications.route('/api/notifications/mark-read/<int:notification_id>', methods=['POST'])
 @login_required
@@ -56,6 +243,24 @@ def mark_notification_read(notification_id):
     
     return jsonify({'success': True})
 
+@notifications.route('/api/notifications/mark-read/broadcast/<int:broadcast_id>', methods=['POST'])
+@login_required
+def mark_broadcast_read(broadcast_id):
+    """Mark a broadcast as read by recording a receipt for the current user"""
+    broadcast = Broadcast.query.filter(
+        Broadcast.id == broadcast_id,
+        *Broadcast.visible_to(current_user)
+    ).first()
+    
+    if not broadcast:
+        return jsonify({'error': 'Notification not found'}), 404
+    
+    if not db.session.get(BroadcastReceipt, (broadcast.id, current_user.id)):
+        db.session.add(BroadcastReceipt(broadcast_id=broadcast.id, user_id=current_user.id))
+        db.session.commit()
+    
+    return jsonify({'success': True})
+
 @notifications.route('/api/notifications/mark-all-read', methods=['POST'])
 @login_required
 def mark_all_read():
@@ -63,6 +268,16 @@ def mark_all_read():
     Notification.query.filter_by(user_id=current_user.id, is_read=False).update({
         'is_read': True
     })
+    
+    # Write the missing receipts of unread broadcasts with one INSERT ... SELECT
+    unread = _visible_broadcasts(current_user).with_only_columns(
+        Broadcast.id,
+        literal(current_user.id, Integer),
+        literal(datetime.utcnow(), DateTime)
+    )
+    db.session.execute(BroadcastReceipt.__table__.insert().from_select(
+        ['broadcast_id', 'user_id', 'read_at'], unread
+    ))
     db.session.commit()
     
     return jsonify({'success': True})
@@ -71,20 +286,11 @@ def mark_all_read():
 @login_required
 def notification_center():
     """Notification center page"""
-    # Get all notifications for current user
-    notifications = Notification.query.filter_by(user_id=current_user.id).filter(
-        (Notification.expires_at.is_(None)) | 
-        (Notification.expires_at > datetime.utcnow())
-    ).order_by(Notification.created_at.desc()).all()
+    # Get all notifications and broadcasts for current user
+    notifications = _inbox(current_user, include_read=True)
     
     # Count unread notifications
-    unread_count = Notification.query.filter_by(
-        user_id=current_user.id, 
-        is_read=False
-    ).filter(
-        (Notification.expires_at.is_(None)) | 
-        (Notification.expires_at > datetime.utcnow())
-    ).count()
+    unread_count = sum(1 for notification in notifications if not notification.is_read)
     
     return render_template('notification_center.html', 
                          notifications=notifications, 
@@ -123,6 +329,35 @@ def notify_task_assigned(student_id, task_title, teacher_name):
         expires_in_hours=168  # 7 days
     )
 
+def queue_notifications(user_ids, title, message, notification_type='info', expires_in_hours=None, key=None, commit=True):
+    """Have the background worker create the same notification for many users.
+
+    The job is part of the caller's transaction; returns the number of users.
+    """
+    user_ids = [int(user_id) for user_id in user_ids]
+    if user_ids:
+        enqueue('create_notifications', {
+            'user_ids': user_ids,
+            'title': title,
+            'message': message,
+            'notification_type': notification_type,
+            'expires_in_hours': expires_in_hours
+        }, key=key)
+    if commit:
+        db.session.commit()
+    return len(user_ids)
+
+def notify_task_assigned_many(student_ids, task_title, teacher_name, commit=True):
+    """Notify several students about the same new task from the background worker"""
+    return queue_notifications(
+        student_ids,
+        title="New Task Assigned",
+        message=f"Task '{task_title}' has been assigned by {teacher_name}",
+        notification_type='info',
+        expires_in_hours=168,  # 7 days
+        commit=commit
+    )
+
 def notify_deadline_reminder(student_id, task_title, hours_left):
     """Notify student about deadline reminder"""
     if hours_left <= 0:
@@ -156,7 +391,7 @@ def notify_submission_received(teacher_id, student_name, task_title):
     )
 
 def send_system_announcement(title, message, target_users='all'):
-    """Send system-wide announcement"""
+    """Send system-wide announcement, returns the number of users notified"""
     return Notification.create_system_notification(
         title=title,
         message=message,
@@ -165,20 +400,16 @@ def send_system_announcement(title, message, target_users='all'):
         expires_in_hours=168  # 7 days
     )
 
-def notify_task_updated(student_ids, task_title, teacher_name):
-    """Notify students when task is updated"""
-    notifications = []
-    for student_id in student_ids:
-        notification = Notification.create_notification(
-            user_id=student_id,
-            title="Task Updated",
-            message=f"Task '{task_title}' has been updated by {teacher_name}",
-            notification_type='info',
-            expires_in_hours=72  # 3 days
-        )
-        notifications.append(notification)
-    
-    return notifications
+def notify_task_updated(student_ids, task_title, teacher_name, commit=True):
+    """Notify students when task is updated, from the background worker"""
+    return queue_notifications(
+        student_ids,
+        title="Task Updated",
+        message=f"Task '{task_title}' has been updated by {teacher_name}",
+        notification_type='info',
+        expires_in_hours=72,  # 3 days
+        commit=commit
+    )
 
 def notify_feedback_received(student_id, task_title, score):
     """Notify student when teacher provides feedback"""
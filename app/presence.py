@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import select, update
+from app import db
+from models.models import User
+import threading
+import time
+
+
+class DatabasePresence:
+    """Record of when users were last seen, kept in ``User.last_seen_at``.
+
+    Every worker writes to and reads from the same column, so all of them show
+    the same users as active. Heartbeats are throttled per process: a user's
+    row is updated at most once per ``write_interval`` seconds, and the other
+    heartbeats only touch an in-memory dict. Another backend (e.g. a Redis
+    sorted set scored by timestamp) can be plugged in with ``set_presence`` as
+    long as it provides the same ``touch``/``online`` methods.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._written = {}
+        self._next_prune = 0
+
+    def touch(self, user_id):
+        """Record a heartbeat for a user"""
+        interval = current_app.config['PRESENCE_WRITE_INTERVAL']
+        now = time.monotonic()
+        with self._lock:
+            if now - self._written.get(user_id, -interval) < interval:
+                return
+            self._written[user_id] = now
+            if now >= self._next_prune:
+                self._written = {uid: written for uid, written in self._written.items() if now - written < interval}
+                self._next_prune = now + interval
+
+        # On its own connection, so the request's session is left alone
+        with db.engine.begin() as connection:
+            connection.execute(update(User).where(User.id == user_id).values(last_seen_at=datetime.utcnow()))
+
+    def online(self, ttl, user_ids=None):
+        """Ids of the users seen within the last ``ttl`` seconds, optionally among ``user_ids``"""
+        query = select(User.id).where(User.last_seen_at > datetime.utcnow() - timedelta(seconds=ttl))
+        if user_ids is not None:
+            if not user_ids:
+                return set()
+            query = query.where(User.id.in_(user_ids))
+        return set(db.session.execute(query).scalars())
+
+
+_presence = DatabasePresence()
+
+
+def get_presence():
+    """Return the presence tracker used by the application"""
+    return _presence
+
+
+def set_presence(presence):
+    """Replace the presence tracker, e.g. with one backed by Redis"""
+    global _presence
+    _presence = presence
+
+
+def touch(user_id):
+    """Record a heartbeat for a user"""
+    _presence.touch(user_id)
+
+
+def online_user_ids(user_ids=None):
+    """Ids of the users active within PRESENCE_TTL seconds"""
+    return _presence.online(current_app.config['PRESENCE_TTL'], user_ids)
+
+
+def init_app(app):
+    """Record a heartbeat for the logged-in user on every page and API request"""
+    @app.before_request
+    def _record_heartbeat():
+        if request.endpoint != 'static' and current_user.is_authenticated:
+            touch(current_user.id)
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+import time
+from sqlalchemy import and_, or_, select
+from app import db
+from models.models import Broadcast, BroadcastReceipt, Notification
+
+# Days read notifications are kept, per notification_type ('default' for the others)
+DEFAULT_RETENTION_DAYS = {
+    'default': 30,
+    'info': 14,
+    'success': 14,
+    'task': 30,
+    'warning': 30,
+    'error': 60
+}
+
+
+def parse_retention(value):
+    """Parse a ``type=days`` comma separated list, e.g. ``"info=7,default=30"``"""
+    retention = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        notification_type, _, days = item.partition('=')
+        retention[notification_type.strip()] = int(days)
+    return retention
+
+
+def _expired_criteria(now):
+    """Notifications that expired, whether or not they were read"""
+    return and_(Notification.expires_at.isnot(None), Notification.expires_at <= now)
+
+
+def _read_criteria(retention, now):
+    """Unexpired read notifications older than the retention of their type"""
+    default_days = retention.get('default', DEFAULT_RETENTION_DAYS['default'])
+    typed = {t: days for t, days in retention.items() if t != 'default'}
+
+    criteria = [
+        and_(Notification.notification_type == notification_type,
+             Notification.created_at < now - timedelta(days=days))
+        for notification_type, days in typed.items()
+    ]
+    criteria.append(and_(
+        Notification.notification_type.notin_(list(typed)),
+        Notification.created_at < now - timedelta(days=default_days)
+    ))
+    return and_(Notification.is_read == True, ~_expired_criteria(now), or_(*criteria))
+
+
+def _delete_in_batches(model, id_column, criteria, batch_size, dry_run=False):
+    """Delete the rows matching ``criteria`` ``batch_size`` at a time.
+
+    Each batch selects a bounded set of ids and deletes them by primary key in its
+    own short transaction, so locks are never held on more than one batch of rows.
+    Returns the number of rows deleted (or that would be with ``dry_run``).
+    """
+    if dry_run:
+        return db.session.query(model).filter(criteria).count()
+
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            select(id_column).where(criteria).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        if model is Broadcast:
+            BroadcastReceipt.query.filter(
+                BroadcastReceipt.broadcast_id.in_(ids)
+            ).delete(synchronize_session=False)
+        deleted += model.query.filter(id_column.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def purge_notifications(retention=None, batch_size=1000, dry_run=False):
+    """Delete expired notifications and read notifications past their retention.
+
+    ``retention`` maps notification types to the number of days read notifications
+    of that type are kept; types not listed use the ``'default'`` entry. Expired
+    broadcasts are removed together with their read receipts. Returns a dict with
+    the number of rows removed by each step and the elapsed seconds.
+    """
+    retention = dict(DEFAULT_RETENTION_DAYS, **(retention or {}))
+    now = datetime.utcnow()
+    started = time.monotonic()
+
+    expired = _delete_in_batches(
+        Notification, Notification.id, _expired_criteria(now), batch_size, dry_run
+    )
+    read = _delete_in_batches(
+        Notification, Notification.id, _read_criteria(retention, now), batch_size, dry_run
+    )
+    broadcasts = _delete_in_batches(
+        Broadcast, Broadcast.id,
+        and_(Broadcast.expires_at.isnot(None), Broadcast.expires_at <= now),
+        batch_size, dry_run
+    )
+
+    return {
+        'expired': expired,
+        'read': read,
+        'broadcasts': broadcasts,
+        'elapsed': time.monotonic() - started
+    }
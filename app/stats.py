@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, case, func, select
+from app import db
+from models.models import Assignment, Class, Submission, Task, User
+import threading
+import time
+
+# Cached site statistics snapshot, shared by the homepage and the admin dashboard
+_snapshot = {'stats': None, 'computed_at': 0.0, 'refreshing': False}
+_snapshot_lock = threading.Lock()
+
+
+def student_task_stats(students):
+    """Assignment statistics for each student, computed in one grouped query.
+
+    Returns one dict per student (in the given order) with the total, completed,
+    in-progress and overdue task counts and the completion rate, as used by the
+    teacher dashboard. Overdue means past the deadline and not completed;
+    assignments whose task was deleted are not counted.
+    """
+    students = list(students)
+    if not students:
+        return []
+
+    now = datetime.utcnow()
+    total = func.count(Assignment.id)
+    completed = func.sum(case((Assignment.status == 'completed', 1), else_=0))
+    rows = db.session.query(
+        Assignment.student_id,
+        total,
+        completed,
+        func.sum(case((Assignment.status == 'in_progress', 1), else_=0)),
+        func.sum(case((and_(Task.deadline < now, Assignment.status != 'completed'), 1), else_=0)),
+        completed * 100.0 / total
+    ).join(Task, Assignment.task_id == Task.id).filter(
+        Assignment.student_id.in_([student.id for student in students])
+    ).group_by(Assignment.student_id).all()
+
+    counts = {row[0]: row[1:] for row in rows}
+
+    student_stats = []
+    for student in students:
+        total_tasks, completed_tasks, in_progress_tasks, overdue_tasks, completion_rate = \
+            counts.get(student.id, (0, 0, 0, 0, 0))
+        student_stats.append({
+            'student': student,
+            'total_tasks': int(total_tasks),
+            'completed_tasks': int(completed_tasks),
+            'in_progress_tasks': int(in_progress_tasks),
+            'overdue_tasks': int(overdue_tasks),
+            'completion_rate': float(completion_rate or 0)
+        })
+    return student_stats
+
+
+def compute_site_stats():
+    """Compute the site-wide statistics with two aggregate queries"""
+    now = datetime.utcnow()
+    week_ago = now - timedelta(days=7)
+
+    # Users per type, plus registrations in the last week
+    users = db.session.query(
+        User.user_type,
+        func.count(User.id),
+        func.sum(case((User.created_at >= week_ago, 1), else_=0))
+    ).group_by(User.user_type).all()
+    user_counts = {user_type: int(count) for user_type, count, _ in users}
+
+    def count(model, *criteria):
+        return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+    totals = db.session.execute(select(
+        count(Class).label('total_classes'),
+        count(Task).label('total_tasks'),
+        count(Task, Task.deadline >= now).label('active_tasks'),
+        count(Task, Task.deadline < now).label('overdue_tasks'),
+        count(Task, Task.created_at >= week_ago).label('new_tasks'),
+        count(Assignment).label('total_assignments'),
+        count(Assignment, Assignment.status == 'completed').label('completed_assignments'),
+        select(func.count()).select_from(Assignment).join(Task, Assignment.task_id == Task.id).where(
+            Assignment.status != 'completed',
+            Task.deadline < now
+        ).scalar_subquery().label('overdue_assignments'),
+        count(Submission).label('total_submissions'),
+        count(Submission, Submission.submitted_at >= week_ago).label('new_submissions')
+    )).mappings().one()
+
+    stats = {key: int(value or 0) for key, value in totals.items()}
+    stats.update({
+        'total_users': sum(user_counts.values()),
+        'total_teachers': user_counts.get('teacher', 0),
+        'total_students': user_counts.get('student', 0),
+        'new_users': sum(int(new or 0) for _, _, new in users),
+    })
+    stats['completion_rate'] = round(
+        stats['completed_assignments'] / stats['total_assignments'] * 100, 1
+    ) if stats['total_assignments'] > 0 else 0
+    return stats
+
+
+def _refresh_site_stats(app):
+    """Recompute the snapshot in a background thread"""
+    try:
+        with app.app_context():
+            stats = compute_site_stats()
+        with _snapshot_lock:
+            _snapshot.update(stats=stats, computed_at=time.monotonic())
+    finally:
+        with _snapshot_lock:
+            _snapshot['refreshing'] = False
+
+
+def get_site_stats():
+    """Return the cached site statistics snapshot.
+
+    The snapshot is computed synchronously the first time; afterwards, once it
+    is older than ``STATS_CACHE_TTL`` seconds, the stale copy keeps being served
+    while a background thread refreshes it.
+    """
+    ttl = current_app.config.get('STATS_CACHE_TTL', 60)
+
+    with _snapshot_lock:
+        stats = _snapshot['stats']
+        stale = time.monotonic() - _snapshot['computed_at'] > ttl
+        start_refresh = ttl > 0 and stats is not None and stale and not _snapshot['refreshing']
+        if start_refresh:
+            _snapshot['refreshing'] = True
+
+    if stats is None or ttl <= 0:
+        stats = compute_site_stats()
+        with _snapshot_lock:
+            _snapshot.update(stats=stats, computed_at=time.monotonic())
+        return dict(stats)
+
+    if start_refresh:
+        app = current_app._get_current_object()
+        threading.Thread(target=_refresh_site_stats, args=(app,), daemon=True).start()
+
+    return dict(stats)
@@ -1,10 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
 from flask_login import login_required, current_user
 from app import db
 from models.models import Assignment, Submission, Task, Class, User
 from .forms import SubmissionForm
-import os
-from werkzeug.utils import secure_filename
+from .uploads import attach_file
+from .file_store import set_attachment
+from .downloads import send_attachment, task_file
+from .assignments import student_assignments
 from datetime import datetime
 
 student = Blueprint('student', __name__)
@@ -18,71 +20,9 @@ def dashboard():
     # Get the student's class
     student_class = current_user.student_class
     
-    if student_class:
-        # Find tasks assigned to the student's class that haven't passed their deadline
-        current_time = datetime.utcnow()
-        class_tasks = Task.query.join(Task.assigned_classes).filter(
-            Class.id == student_class.id,
-            Task.deadline > current_time  # Only tasks that haven't passed deadline
-        ).all()
-        
-        # Create assignments for tasks that don't have one for this student
-        new_assignments = []
-        for task in class_tasks:
-            existing_assignment = Assignment.query.filter_by(
-                task_id=task.id,
-                student_id=current_user.id
-            ).first()
-            
-            if not existing_assignment:
-                # Create new assignment for this student
-                assignment = Assignment(
-                    task_id=task.id,
-                    student_id=current_user.id,
-                    status='pending'
-                )
-                db.session.add(assignment)
-                new_assignments.append(task)
-        
-        db.session.commit()
-        
-        # Create notifications for new assignments
-        from app.notifications import notify_task_assigned
-        for task in new_assignments:
-            creator = User.query.get(task.created_by)
-            teacher_name = creator.name if creator else 'Your teacher'
-            notify_task_assigned(current_user.id, task.title, teacher_name)
-    
-    # Get all assignments for the student
-    assignments = Assignment.query.filter_by(student_id=current_user.id).all()
-    
-    # Filter out assignments where the task has passed deadline
-    valid_assignments = []
-    current_time = datetime.utcnow()
-    for assignment in assignments:
-        if assignment.task and assignment.task.deadline > current_time:
-            valid_assignments.append(assignment)
-        elif not assignment.task:
-            # Task was deleted, remove the assignment
-            db.session.delete(assignment)
-    
-    db.session.commit()
-    
-    # Sort by priority and deadline
-    priority_order = {
-        'urgent_important': 1,
-        'important_not_urgent': 2,
-        'urgent_not_important': 3,
-        'high_priority': 4,
-        'medium_priority': 5,
-        'low_priority': 6,
-        'long_term': 7,
-        'group_task': 8,
-        'optional': 9,
-        'not_important_not_urgent': 10
-    }
-    
-    valid_assignments.sort(key=lambda x: (priority_order.get(x.task.priority, 99), x.task.deadline))
+    # Assignments are materialized when tasks are assigned (and by the background
+    # reconciler), so the dashboard only reads; they come sorted by priority and deadline
+    valid_assignments = student_assignments(current_user.id, active_only=True)
     
     # Get count of students in the same class
     class_students_count = 0
@@ -135,21 +75,13 @@ def submit_task(assignment_id):
 
     form = SubmissionForm()
     if form.validate_on_submit():
-        file_path = None
-        if form.file.data:
-            filename = secure_filename(form.file.data.filename)
-            if filename:
-                # Create unique filename
-                import uuid
-                unique_filename = str(uuid.uuid4()) + '_' + filename
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                form.file.data.save(file_path)
+        attached = attach_file(form.file.data, form.upload_id.data, 'submission')
 
         submission = Submission(
             assignment_id=assignment.id,
-            content=form.content.data,
-            file_path=file_path
+            content=form.content.data
         )
+        set_attachment(submission, attached)
         db.session.add(submission)
         assignment.status = 'completed'
         assignment.submitted_at = submission.submitted_at
@@ -162,30 +94,20 @@ def submit_task(assignment_id):
 @student.route('/download_student_task_file/<int:task_id>')
 @login_required
 def download_student_task_file(task_id):
-    print(f"DEBUG: Student download request for task {task_id} by user {current_user.id} ({current_user.user_type})")
-
     if current_user.user_type != 'student':
-        print(f"DEBUG: Wrong user type: {current_user.user_type}")
         return f"<h1>Error: Access denied</h1><p>Students only (user type: {current_user.user_type})</p>", 403
 
-    from models.models import Task
-    task = Task.query.get_or_404(task_id)
-    print(f"DEBUG: Task found: {task.title}, file_path: {task.file_path}")
+    # The task's file and the student's assignment to it, in one query
+    task = task_file(task_id, student_id=current_user.id)
+    if task is None:
+        abort(404)
 
     # Check if student is assigned to this task
-    assignment = Assignment.query.filter_by(task_id=task_id, student_id=current_user.id).first()
-    print(f"DEBUG: Assignment check: {assignment}")
-    if not assignment:
-        print(f"DEBUG: No assignment found for student {current_user.id} and task {task_id}")
+    if task.assignment_id is None:
         return f"<h1>Error: Access denied</h1><p>You are not assigned to task {task_id} (student_id: {current_user.id})</p>", 403
 
-    if not task.file_path:
-        print(f"DEBUG: No file path for task {task_id}")
-        return f"<h1>Error: No file attached</h1><p>Task {task_id} has no attached file</p>", 404
-
-    if not os.path.exists(task.file_path):
-        print(f"DEBUG: File does not exist at {task.file_path}")
-        return f"<h1>Error: File not found</h1><p>File not found at path: {task.file_path}</p>", 404
+    response = send_attachment(task)
+    if response is None:
+        return f"<h1>Error: File not found</h1><p>Task {task_id} has no attached file</p>", 404
 
-    print(f"DEBUG: Sending file: {task.file_path}")
-    return send_file(task.file_path, as_attachment=True)
\ No newline at end of file
+    return response
\ No newline at end of file
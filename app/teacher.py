@@ -1,11 +1,17 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, Response
 from flask_login import login_required, current_user
+from sqlalchemy import select
 from app import db
-from models.models import Task, Assignment, User, Submission, Class, Subject, teacher_class_subjects
+from models.models import Task, Assignment, User, Submission, Class, Subject
 from .forms import TaskForm, AssignmentForm, TeacherSubjectForm
 from ml.priority_predictor import predict_priority
+from .uploads import attach_file
+from .file_store import release_attachments, set_attachment
+from .downloads import send_attachment, submission_file, submissions_archive, task_file
+from .assignments import create_assignments, sync_task_classes
+from .stats import student_task_stats
+from .teacher_context import get_teacher_context
 from datetime import datetime
-import os
 from werkzeug.utils import secure_filename
 
 teacher = Blueprint('teacher', __name__)
@@ -32,72 +38,11 @@ def dashboard():
             unique_tasks[task.id] = task
     tasks = list(unique_tasks.values())
 
-    # Get teacher's classes from teacher_class_subjects table
-    teacher_classes = []
-    class_subject_mapping = db.session.query(teacher_class_subjects).filter_by(teacher_id=current_user.id).all()
-    for tc in class_subject_mapping:
-        class_obj = Class.query.get(tc.class_id)
-        if class_obj and class_obj not in teacher_classes:
-            teacher_classes.append(class_obj)
-    
-    # Also get from teaching_classes relationship (backwards compatibility)
-    for class_obj in current_user.teaching_classes:
-        if class_obj not in teacher_classes:
-            teacher_classes.append(class_obj)
-
-    students = []
-    for class_obj in teacher_classes:
-        students.extend(class_obj.students)
-    # Remove duplicates in case a student is in multiple classes
-    students = list(set(students))
-
-    student_stats = []
-    for student in students:
-        assignments = Assignment.query.filter_by(student_id=student.id).all()
-        total_tasks = len(assignments)
-        completed_tasks = len([a for a in assignments if a.status == 'completed'])
-        in_progress_tasks = len([a for a in assignments if a.status == 'in_progress'])
-        overdue_tasks = len([a for a in assignments if a.is_overdue])
-
-        student_stats.append({
-            'student': student,
-            'total_tasks': total_tasks,
-            'completed_tasks': completed_tasks,
-            'in_progress_tasks': in_progress_tasks,
-            'overdue_tasks': overdue_tasks,
-            'completion_rate': (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-        })
+    context = get_teacher_context()
+    student_stats = student_task_stats(context.students)
 
     # Get teacher's classes with subject information
-    teacher_classes_info = []
-
-    for class_obj in teacher_classes:
-        # Get subjects available in this class
-        available_subjects = class_obj.subjects
-        # Get subjects the teacher is assigned to teach in this class (from teacher_class_subjects table)
-        teaching_subjects = []
-        for subject in available_subjects:
-            # Check if there's an entry in teacher_class_subjects for this teacher, class, and subject
-            entry = db.session.query(teacher_class_subjects).filter_by(
-                teacher_id=current_user.id, 
-                class_id=class_obj.id, 
-                subject_id=subject.id
-            ).first()
-            if entry:
-                teaching_subjects.append(subject)
-        
-        # Also include subjects from selected_subjects (for backwards compatibility)
-        selected_subject_ids = [s.id for s in current_user.selected_subjects]
-        for subject in available_subjects:
-            if subject.id in selected_subject_ids and subject not in teaching_subjects:
-                teaching_subjects.append(subject)
-
-        teacher_classes_info.append({
-            'class': class_obj,
-            'available_subjects': available_subjects,
-            'teaching_subjects': teaching_subjects,
-            'student_count': len(class_obj.students)
-        })
+    teacher_classes_info = context.classes_info()
     
     print(f"DEBUG: Teacher {current_user.name} has {len(teacher_classes_info)} classes")
     
@@ -115,18 +60,13 @@ def select_subjects():
     form = TeacherSubjectForm()
 
     # Get all subjects from the teacher's classes
-    teacher_classes = current_user.teaching_classes
-    available_subjects = []
-    for class_obj in teacher_classes:
-        for subject in class_obj.subjects:
-            available_subjects.append((subject.id, f"{subject.name} ({class_obj.name})"))
-
-    form.subjects.choices = available_subjects
+    context = get_teacher_context()
+    teacher_classes = context.classes
+    form.subjects.choices = context.subject_choices()
 
     if request.method == 'GET':
         # Pre-select currently selected subjects
-        current_selected_ids = [subject.id for subject in current_user.selected_subjects]
-        form.subjects.data = current_selected_ids
+        form.subjects.data = list(context.selected_subject_ids)
 
     if form.validate_on_submit():
         # Clear existing subject selections
@@ -154,26 +94,10 @@ def create_task():
     if current_user.user_type != 'teacher':
         return redirect(url_for('main.dashboard'))
 
-    # Get classes that the teacher teaches
-    teacher_classes = []
-    
-    # First, check teacher_class_subjects table (new way)
-    class_subject_mapping = db.session.query(teacher_class_subjects).filter_by(teacher_id=current_user.id).all()
-    for tc in class_subject_mapping:
-        class_obj = Class.query.get(tc.class_id)
-        if class_obj and class_obj not in teacher_classes:
-            teacher_classes.append(class_obj)
-    
-    # Also check teaching_classes relationship (backwards compatibility)
-    for class_obj in current_user.teaching_classes:
-        if class_obj not in teacher_classes:
-            teacher_classes.append(class_obj)
-    
-    # Get all students from teacher's classes
-    students = []
-    for class_obj in teacher_classes:
-        students.extend(class_obj.students)
-    students = list(set(students))
+    # Get classes that the teacher teaches and their students
+    context = get_teacher_context()
+    teacher_classes = context.classes
+    students = context.students
 
     form = TaskForm()
     form.assigned_classes.choices = [(c.id, c.name) for c in teacher_classes]
@@ -187,15 +111,7 @@ def create_task():
             form.priority.data = suggested_priority
 
         # Handle file upload
-        file_path = None
-        if form.task_file.data:
-            filename = secure_filename(form.task_file.data.filename)
-            if filename:
-                # Create unique filename
-                import uuid
-                unique_filename = str(uuid.uuid4()) + '_' + filename
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                form.task_file.data.save(file_path)
+        attached = attach_file(form.task_file.data, form.upload_id.data, 'task')
 
         task = Task(
             title=form.title.data,
@@ -203,62 +119,24 @@ def create_task():
             deadline=form.deadline.data,
             priority=form.priority.data,
             instructions=form.instructions.data,
-            file_path=file_path,
             created_by=current_user.id
         )
+        set_attachment(task, attached)
         db.session.add(task)
-        db.session.commit()
+        db.session.flush()
 
         # Add assigned classes to the task (for tracking which classes the task is assigned to)
         if form.assigned_classes.data:
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj and class_obj not in task.assigned_classes:
-                    task.assigned_classes.append(class_obj)
-            db.session.commit()
-
-        # Create assignments for students
-        assigned_students = []
-        
-        # First, assign to specific students if selected
-        if form.assigned_students.data:
-            for student_id in form.assigned_students.data:
-                student = User.query.get(int(student_id))
-                if student:
-                    # Check if assignment already exists
-                    existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                    if not existing:
-                        assignment = Assignment(
-                            task_id=task.id,
-                            student_id=student.id
-                        )
-                        db.session.add(assignment)
-                        assigned_students.append(student.id)
-        
-        # Then, assign to students in selected classes (if no specific students selected)
-        if not form.assigned_students.data and form.assigned_classes.data:
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj:
-                    for student in class_obj.students:
-                        # Check if assignment already exists
-                        existing = Assignment.query.filter_by(task_id=task.id, student_id=student.id).first()
-                        if not existing:
-                            assignment = Assignment(
-                                task_id=task.id,
-                                student_id=student.id
-                            )
-                            db.session.add(assignment)
-                            assigned_students.append(student.id)
-        
-        db.session.commit()
-
-        # Create notifications for assigned students
-        from app.notifications import notify_task_assigned
-        for student_id in assigned_students:
-            student = User.query.get(student_id)
-            if student:
-                notify_task_assigned(student_id, task.title, current_user.name)
+            task.assigned_classes = Class.query.filter(Class.id.in_(form.assigned_classes.data)).all()
+
+        # Assign to specific students if selected, otherwise to the students of the selected classes.
+        # The task, its assignments and the notification job are committed together.
+        create_assignments(
+            task,
+            student_ids=form.assigned_students.data,
+            class_ids=form.assigned_classes.data if not form.assigned_students.data else None,
+            teacher_name=current_user.name
+        )
 
         flash('Task created successfully!', 'success')
         return redirect(url_for('teacher.dashboard'))
@@ -287,31 +165,14 @@ def assign_task(task_id):
         return redirect(url_for('teacher.dashboard'))
     
     # Get students from the teacher's classes only
-    teacher_classes = current_user.teaching_classes
-    students = []
-    for class_obj in teacher_classes:
-        students.extend(class_obj.students)
-    # Remove duplicates in case a student is in multiple classes
-    students = list(set(students))
+    students = get_teacher_context().students
 
     form = AssignmentForm()
     form.students.choices = [(str(s.id), s.name) for s in students]
     
     if form.validate_on_submit():
         selected_students = request.form.getlist('students')
-        assigned_students = []
-        for student_id in selected_students:
-            assignment = Assignment(task_id=task.id, student_id=int(student_id))
-            db.session.add(assignment)
-            assigned_students.append(int(student_id))
-        db.session.commit()
-        
-        # Create notifications for assigned students
-        from app.notifications import notify_task_assigned
-        for student_id in assigned_students:
-            student = User.query.get(student_id)
-            if student:
-                notify_task_assigned(student_id, task.title, current_user.name)
+        create_assignments(task, student_ids=selected_students, teacher_name=current_user.name)
         
         flash('Task assigned successfully!')
         return redirect(url_for('teacher.dashboard'))
@@ -395,16 +256,19 @@ def download_file(submission_id):
     if current_user.user_type != 'teacher':
         return redirect(url_for('main.dashboard'))
 
-    submission = Submission.query.get_or_404(submission_id)
-    if submission.assignment.task.created_by != current_user.id:
+    submission = submission_file(submission_id)
+    if submission is None:
+        abort(404)
+    if submission.created_by != current_user.id:
         flash('Access denied')
         return redirect(url_for('teacher.dashboard'))
 
-    if not submission.file_path or not os.path.exists(submission.file_path):
+    response = send_attachment(submission)
+    if response is None:
         flash('File not found')
         return redirect(url_for('teacher.view_submission', assignment_id=submission.assignment_id))
 
-    return send_file(submission.file_path, as_attachment=True)
+    return response
 
 @teacher.route('/download_task_file/<int:task_id>')
 @login_required
@@ -412,16 +276,41 @@ def download_task_file(task_id):
     if current_user.user_type != 'teacher':
         return redirect(url_for('main.dashboard'))
 
-    task = Task.query.get_or_404(task_id)
+    task = task_file(task_id)
+    if task is None:
+        abort(404)
     if task.created_by != current_user.id:
         flash('Access denied')
         return redirect(url_for('teacher.dashboard'))
 
-    if not task.file_path or not os.path.exists(task.file_path):
+    response = send_attachment(task)
+    if response is None:
         flash('File not found')
         return redirect(url_for('teacher.dashboard'))
 
-    return send_file(task.file_path, as_attachment=True)
+    return response
+
+@teacher.route('/download_all_submissions/<int:task_id>')
+@login_required
+def download_all_submissions(task_id):
+    """Stream a ZIP of every submission file of a task with a manifest of scores and feedback"""
+    if current_user.user_type != 'teacher':
+        return redirect(url_for('main.dashboard'))
+
+    task = Task.query.get_or_404(task_id)
+    if task.created_by != current_user.id:
+        flash('Access denied')
+        return redirect(url_for('teacher.dashboard'))
+
+    filename = f"{secure_filename(task.title) or 'task'}_submissions.zip"
+    return Response(
+        submissions_archive(task.id),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'X-Accel-Buffering': 'no'  # let nginx pass the archive on as it is written
+        }
+    )
 
 @teacher.route('/edit_task/<int:task_id>', methods=['GET', 'POST'])
 @login_required
@@ -435,7 +324,7 @@ def edit_task(task_id):
         return redirect(url_for('teacher.dashboard'))
 
     # Get classes that the teacher teaches
-    teacher_classes = current_user.teaching_classes
+    teacher_classes = get_teacher_context().classes
 
     form = TaskForm()
     form.assigned_classes.choices = [(str(c.id), c.name) for c in teacher_classes]
@@ -463,19 +352,10 @@ def edit_task(task_id):
             form.priority.data = suggested_priority
 
         # Handle file upload
-        file_path = task.file_path  # Keep existing file by default
-        if form.task_file.data:
-            filename = secure_filename(form.task_file.data.filename)
-            if filename:
-                # Remove old file if exists
-                if task.file_path and os.path.exists(task.file_path):
-                    os.remove(task.file_path)
-
-                # Create unique filename
-                import uuid
-                unique_filename = str(uuid.uuid4()) + '_' + filename
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                form.task_file.data.save(file_path)
+        attached = attach_file(form.task_file.data, form.upload_id.data, 'task')
+        if attached:
+            # Release the old file, otherwise keep it
+            set_attachment(task, attached)
 
         # Update task
         task.title = form.title.data
@@ -483,45 +363,23 @@ def edit_task(task_id):
         task.deadline = form.deadline.data
         task.priority = form.priority.data
         task.instructions = form.instructions.data
-        task.file_path = file_path
 
         # Update assignments
         if form.assigned_classes.data:
-            # Remove existing assignments
-            Assignment.query.filter_by(task_id=task.id).delete()
-            db.session.commit()
-
-            # Create new assignments for students in selected classes
-            assigned_students = []
-            for class_id in form.assigned_classes.data:
-                class_obj = Class.query.get(int(class_id))
-                if class_obj:
-                    for student in class_obj.students:
-                        assignment = Assignment(
-                            task_id=task.id,
-                            student_id=student.id
-                        )
-                        db.session.add(assignment)
-                        assigned_students.append(student.id)
+            # Keep only the students of the selected classes and notify the new ones
+            retained_students = [a.student_id for a in Assignment.query.filter(
+                Assignment.task_id == task.id,
+                Assignment.student_id.in_(db.session.query(User.id).filter(User.class_id.in_(form.assigned_classes.data)))
+            ).all()]
+            sync_task_classes(task, form.assigned_classes.data, teacher_name=current_user.name, commit=False)
+        else:
+            retained_students = [a.student_id for a in Assignment.query.filter_by(task_id=task.id).all()]
 
-            db.session.commit()
+        # Create notifications for students whose task was updated
+        from app.notifications import notify_task_updated
+        notify_task_updated(retained_students, task.title, current_user.name, commit=False)
+        db.session.commit()
 
-            # Create notifications for newly assigned students
-            from app.notifications import notify_task_assigned, notify_task_updated
-            for student_id in assigned_students:
-                student = User.query.get(student_id)
-                if student:
-                    notify_task_assigned(student_id, task.title, current_user.name)
-        else:
-            # If no classes selected, remove all assignments and send update notification
-            assigned_students = []
-            for assignment in Assignment.query.filter_by(task_id=task.id).all():
-                assigned_students.append(assignment.student_id)
-
-            # Create notifications for students whose task was updated
-            from app.notifications import notify_task_updated
-            if assigned_students:
-                notify_task_updated(assigned_students, task.title, current_user.name)
         flash('Task updated successfully!')
         return redirect(url_for('teacher.dashboard'))
 
@@ -543,20 +401,15 @@ def delete_task(task_id):
         return redirect(url_for('teacher.dashboard'))
     
     try:
-        # Remove associated file if exists
-        if task.file_path and os.path.exists(task.file_path):
-            os.remove(task.file_path)
+        # Release the task's file and its submissions' files, they are removed
+        # from disk once nothing references them anymore
+        release_attachments(Task, Task.id == task.id)
         
-        # Delete all related assignments and submissions
-        assignments = Assignment.query.filter_by(task_id=task.id).all()
-        for assignment in assignments:
-            # Remove submission files
-            submissions = Submission.query.filter_by(assignment_id=assignment.id).all()
-            for submission in submissions:
-                if submission.file_path and os.path.exists(submission.file_path):
-                    os.remove(submission.file_path)
-                db.session.delete(submission)
-            db.session.delete(assignment)
+        # Delete all related assignments and submissions, whatever their number
+        assignment_ids = select(Assignment.id).where(Assignment.task_id == task.id)
+        release_attachments(Submission, Submission.assignment_id.in_(assignment_ids))
+        Submission.query.filter(Submission.assignment_id.in_(assignment_ids)).delete(synchronize_session=False)
+        Assignment.query.filter_by(task_id=task.id).delete(synchronize_session=False)
         
         # Delete the task
         db.session.delete(task)
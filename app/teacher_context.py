@@ -0,0 +1,79 @@
+from flask import g
+from flask_login import current_user
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from app import db
+from models.models import Class, User, teacher_class_subjects, teacher_classes, teacher_subjects
+
+
+class TeacherContext:
+    """The classes, subjects and students a teacher works with.
+
+    A teacher teaches a class through ``teacher_class_subjects`` (class, subject)
+    pairs or, for older data, the ``teacher_classes`` mapping, and picks subjects
+    through ``teacher_subjects``. Everything is loaded up front in a fixed number
+    of queries (the three mappings, then the classes with their subjects and
+    students eagerly loaded), whatever the number of classes.
+    """
+
+    def __init__(self, teacher_id):
+        self.teacher_id = teacher_id
+
+        self.teaching_pairs = set(db.session.execute(
+            select(teacher_class_subjects.c.class_id, teacher_class_subjects.c.subject_id)
+            .where(teacher_class_subjects.c.teacher_id == teacher_id)
+        ).all())
+        legacy_class_ids = set(db.session.execute(
+            select(teacher_classes.c.class_id).where(teacher_classes.c.teacher_id == teacher_id)
+        ).scalars())
+        self.selected_subject_ids = set(db.session.execute(
+            select(teacher_subjects.c.subject_id).where(teacher_subjects.c.teacher_id == teacher_id)
+        ).scalars())
+
+        self.class_ids = {class_id for class_id, _ in self.teaching_pairs} | legacy_class_ids
+        if self.class_ids:
+            self.classes = Class.query.filter(Class.id.in_(self.class_ids)).options(
+                selectinload(Class.subjects),
+                selectinload(Class.students)
+            ).order_by(Class.name).all()
+        else:
+            self.classes = []
+
+        students = {}
+        for class_obj in self.classes:
+            for student in class_obj.students:
+                if student.user_type == 'student':
+                    students[student.id] = student
+        self.students = sorted(students.values(), key=lambda student: student.name)
+
+    def teaching_subjects(self, class_obj):
+        """Subjects of a class the teacher teaches, through a pair or a selected subject"""
+        return [
+            subject for subject in class_obj.subjects
+            if (class_obj.id, subject.id) in self.teaching_pairs or subject.id in self.selected_subject_ids
+        ]
+
+    def classes_info(self):
+        """Per-class summary shown on the teacher dashboard"""
+        return [{
+            'class': class_obj,
+            'available_subjects': class_obj.subjects,
+            'teaching_subjects': self.teaching_subjects(class_obj),
+            'student_count': sum(1 for student in class_obj.students if student.user_type == 'student')
+        } for class_obj in self.classes]
+
+    def subject_choices(self):
+        """(subject id, label) choices of the subjects taught in the teacher's classes"""
+        return [
+            (subject.id, f"{subject.name} ({class_obj.name})")
+            for class_obj in self.classes
+            for subject in class_obj.subjects
+        ]
+
+
+def get_teacher_context():
+    """Return the current teacher's context, loaded once per request"""
+    context = g.get('teacher_context')
+    if context is None or context.teacher_id != current_user.id:
+        context = g.teacher_context = TeacherContext(current_user.id)
+    return context
@@ -0,0 +1,262 @@
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from datetime import datetime, timedelta
+from app import db
+from app.cache import TTLCache
+from app.file_store import AttachedFile, release, store_file, store_stream
+from models.models import Upload
+import hashlib
+import os
+import re
+import uuid
+
+uploads = Blueprint('uploads', __name__)
+
+# Block size used to copy request bodies to disk, whatever the chunk size
+COPY_BLOCK_SIZE = 64 * 1024
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# Running SHA-256 of the uploads this process is receiving, keyed by upload id
+# as ``(offset, hasher)``. A chunk landing on another worker (or after the entry
+# expired) rehashes the partial file from disk instead.
+_hashers = None
+
+
+def _get_hashers():
+    global _hashers
+    if _hashers is None:
+        _hashers = TTLCache(current_app.config['UPLOAD_EXPIRY_HOURS'] * 3600, maxsize=1000)
+    return _hashers
+
+
+def allowed_extensions(purpose):
+    """File extensions accepted for task files or submission files"""
+    from .forms import SUBMISSION_FILE_EXTENSIONS, TASK_FILE_EXTENSIONS
+    return TASK_FILE_EXTENSIONS if purpose == 'task' else SUBMISSION_FILE_EXTENSIONS
+
+
+def save_form_file(file_storage):
+    """Store a file posted through a regular form field; returns an ``AttachedFile`` or None"""
+    filename = secure_filename(file_storage.filename or '')
+    if not filename:
+        return None
+    return AttachedFile(store_stream(file_storage.stream), filename)
+
+
+def partial_path(upload_id):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial', upload_id)
+
+
+def _hash_file(path, length):
+    """SHA-256 of the first ``length`` bytes of a file, read in blocks"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while length > 0:
+            block = f.read(min(COPY_BLOCK_SIZE, length))
+            if not block:
+                break
+            hasher.update(block)
+            length -= len(block)
+    return hasher
+
+
+def _remove(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _serialize(upload):
+    return {
+        'id': upload.id,
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'complete': upload.is_complete,
+        'sha256': upload.sha256
+    }
+
+
+def _finish(upload, hasher):
+    """Move a fully received upload into the file store, the upload holds a reference until claimed"""
+    upload.sha256 = store_file(partial_path(upload.id), hasher.hexdigest())
+
+
+def purge_stale_uploads(user_id=None, commit=True):
+    """Delete uploads older than UPLOAD_EXPIRY_HOURS that were never attached, with their files"""
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config['UPLOAD_EXPIRY_HOURS'])
+    query = Upload.query.filter(Upload.created_at < cutoff)
+    if user_id is not None:
+        query = query.filter(Upload.user_id == user_id)
+
+    return _discard(query.all(), commit)
+
+
+def delete_user_uploads(user_id, commit=True):
+    """Delete every unattached upload of a user, with their files"""
+    return _discard(Upload.query.filter_by(user_id=user_id).all(), commit)
+
+
+def _discard(uploads, commit):
+    for upload in uploads:
+        if upload.is_complete:
+            release([upload.sha256])
+        else:
+            _remove(partial_path(upload.id))
+        _get_hashers().pop(upload.id)
+        db.session.delete(upload)
+    if commit:
+        db.session.commit()
+    return len(uploads)
+
+
+def claim_upload(upload_id, purpose):
+    """Take a completed upload of the current user to attach it; returns an ``AttachedFile``.
+
+    The upload record is removed and its reference to the stored file passes to
+    the task or submission. Returns None when there is no such completed upload.
+    """
+    upload = Upload.query.filter_by(id=upload_id, user_id=current_user.id, purpose=purpose).first()
+    if not upload or not upload.is_complete:
+        return None
+    db.session.delete(upload)
+    return AttachedFile(upload.sha256, upload.filename)
+
+
+def attach_file(file_storage, upload_id, purpose):
+    """The stored file attached to a form, uploaded in chunks or through the file field"""
+    if upload_id:
+        return claim_upload(upload_id, purpose)
+    if file_storage:
+        return save_form_file(file_storage)
+    return None
+
+
+def _can_upload(purpose):
+    if purpose == 'task':
+        return current_user.user_type in ('teacher', 'admin')
+    return current_user.user_type == 'student'
+
+
+@uploads.route('/api/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    """Start a chunked upload from ``filename``, ``size`` and ``purpose``"""
+    data = request.get_json(silent=True) or {}
+    purpose = data.get('purpose')
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+
+    if purpose not in Upload.PURPOSES or not _can_upload(purpose):
+        return jsonify({'error': 'Invalid upload purpose'}), 400
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in allowed_extensions(purpose):
+        return jsonify({'error': 'File type not allowed'}), 400
+    if not isinstance(size, int) or size < 0:
+        return jsonify({'error': 'File size is required'}), 400
+    if size > current_app.config['UPLOAD_MAX_SIZE']:
+        return jsonify({'error': 'File is too large'}), 413
+
+    purge_stale_uploads(current_user.id, commit=False)
+
+    upload = Upload(id=uuid.uuid4().hex, user_id=current_user.id, purpose=purpose,
+                    filename=filename, size=size, received=0)
+    os.makedirs(os.path.dirname(partial_path(upload.id)), exist_ok=True)
+    open(partial_path(upload.id), 'wb').close()
+    if size == 0:
+        _finish(upload, hashlib.sha256())
+    db.session.add(upload)
+    db.session.commit()
+
+    body = _serialize(upload)
+    body['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+    return jsonify(body), 201
+
+
+@uploads.route('/api/uploads/<upload_id>')
+@login_required
+def upload_status(upload_id):
+    """How many bytes of an upload were received, for resuming it"""
+    upload = Upload.query.filter_by(id=upload_id, user_id=current_user.id).first()
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(_serialize(upload))
+
+
+@uploads.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """Append one chunk, sent as the raw body with a ``Content-Range`` header.
+
+    The body is copied to the partial file block by block while updating the
+    checksum, so memory use doesn't depend on the file size. A chunk must start
+    at the current offset, otherwise 409 is returned with the offset to resume
+    from. The last chunk moves the file into UPLOAD_FOLDER.
+    """
+    upload = Upload.query.filter_by(id=upload_id, user_id=current_user.id).first()
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    if upload.is_complete:
+        return jsonify(_serialize(upload))
+
+    match = _CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+    if not match:
+        return jsonify({'error': 'Content-Range header is required'}), 400
+    start, end, total = (int(value) for value in match.groups())
+    length = end - start + 1
+    if total != upload.size or length <= 0 or end >= total or request.content_length != length:
+        return jsonify({'error': 'Invalid Content-Range'}), 400
+    if length > current_app.config['UPLOAD_CHUNK_SIZE']:
+        return jsonify({'error': 'Chunk is too large'}), 413
+    if start != upload.received:
+        return jsonify(_serialize(upload)), 409
+
+    path = partial_path(upload.id)
+    offset, hasher = _get_hashers().pop(upload.id) or (None, None)
+    if offset != start:
+        hasher = _hash_file(path, start)
+
+    # Release the connection while the body streams in
+    db.session.close()
+
+    written = 0
+    with open(path, 'r+b') as f:
+        f.seek(start)
+        f.truncate()
+        while written < length:
+            block = request.stream.read(min(COPY_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            hasher.update(block)
+            written += len(block)
+
+    # Only the client that started at the current offset may move it forward
+    received = start + written
+    moved = Upload.query.filter_by(id=upload_id, received=start).update({'received': received})
+    if not moved:
+        db.session.rollback()
+        return jsonify(_serialize(db.session.get(Upload, upload_id))), 409
+
+    upload = db.session.get(Upload, upload_id)
+    if received == upload.size:
+        _finish(upload, hasher)
+    else:
+        _get_hashers().set(upload.id, (received, hasher))
+    db.session.commit()
+
+    if written < length:
+        # The client went away mid-chunk, it can resume from the new offset
+        return jsonify(_serialize(upload)), 400
+    return jsonify(_serialize(upload))
+
+
+@uploads.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(upload_id):
+    """Abort an upload and remove what was received"""
+    upload = Upload.query.filter_by(id=upload_id, user_id=current_user.id).first()
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    _discard([upload], commit=True)
+    return jsonify({'success': True})
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Print the query plans of the hot dashboard, notification and forum queries.
+
+Uses EXPLAIN QUERY PLAN on SQLite and EXPLAIN on PostgreSQL so you can confirm
+the indexes created by migrate_add_indexes.py are picked up, e.g. look for
+"USING INDEX ix_..." (SQLite) or "Index Scan using ix_..." (PostgreSQL).
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime
+from app import create_app, db
+from models.models import Assignment, Task, Notification, ChatMessage, Submission
+
+def hot_queries():
+    """The queries behind the busiest pages, with representative parameters"""
+    now = datetime.utcnow()
+    return {
+        'Student dashboard: assignments with their tasks': Assignment.query.join(Assignment.task).filter(
+            Assignment.student_id == 1,
+            Task.deadline > now
+        ),
+        'Teacher dashboard: assignment status counts': Assignment.query.filter(
+            Assignment.student_id.in_([1, 2, 3]),
+            Assignment.status == 'completed'
+        ),
+        'Teacher dashboard: tasks created by / assigned to a teacher': Task.query.filter(
+            (Task.created_by == 1) | (Task.assigned_teacher_id == 1)
+        ),
+        'Task progress: assignments of a task': Assignment.query.filter_by(task_id=1),
+        'Review submissions: submissions of an assignment': Submission.query.filter_by(assignment_id=1),
+        'Notifications: unread, unexpired for a user': Notification.query.filter_by(
+            user_id=1,
+            is_read=False
+        ).filter(
+            (Notification.expires_at.is_(None)) | (Notification.expires_at > now)
+        ).order_by(Notification.created_at.desc()).limit(10),
+        'Forum: new messages in a room': ChatMessage.query.filter(
+            ChatMessage.room_id == 1,
+            ChatMessage.is_deleted == False,
+            ChatMessage.id > 0
+        ).order_by(ChatMessage.id.asc()),
+    }
+
+def explain(query):
+    """Return the plan rows for a query on the current database"""
+    dialect = db.engine.dialect
+    compiled = query.statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as connection:
+        return connection.exec_driver_sql(prefix + str(compiled), params).fetchall()
+
+def explain_hot_queries():
+    app = create_app()
+
+    with app.app_context():
+        print(f"Database: {db.engine.dialect.name}")
+        for name, query in hot_queries().items():
+            print(f"\n=== {name} ===")
+            for row in explain(query):
+                # SQLite returns (id, parent, notused, detail), PostgreSQL one text column
+                print(f"  {row[-1]}")
+
+if __name__ == '__main__':
+    explain_hot_queries()
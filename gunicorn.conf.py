@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for SMART Edu Task Manager.
+
+Gevent workers let a single worker hold thousands of idle long-poll and
+event-stream connections (notifications, forum updates) without a thread per
+client. Set WEB_CONCURRENCY to change the number of worker processes.
+
+Live events (app/events.py) are kept in each worker's memory. Notifications
+written by another worker or the job worker reach long-polls through a watcher
+that checks the database every NOTIFICATION_WATCH_INTERVAL seconds, and forum
+streams only see messages posted through other workers on their next
+keepalive. Plug a shared hub in with ``set_hub`` when those delays matter.
+"""
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+timeout = 120
+
+def post_fork(server, worker):
+    """Make psycopg2 yield to other greenlets while waiting on PostgreSQL"""
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+        from gevent.socket import wait_read, wait_write
+    except ImportError:
+        return
+
+    def gevent_wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+    extensions.set_wait_callback(gevent_wait_callback)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the last_seen_at column to the User table.
+
+Forum presence is read from this column so that every worker shows the same
+active users. Safe to run repeatedly, on both SQLite and PostgreSQL.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        inspector = db.inspect(db.engine)
+        columns = {column['name'] for column in inspector.get_columns('user')}
+
+        if 'last_seen_at' in columns:
+            print("SUCCESS: Column 'last_seen_at' already exists")
+        else:
+            print("Adding column 'last_seen_at' to user...")
+            db.session.execute(db.text('ALTER TABLE "user" ADD COLUMN last_seen_at TIMESTAMP'))
+            db.session.commit()
+            print("SUCCESS: Column 'last_seen_at' added")
+
+if __name__ == '__main__':
+    print("Starting last_seen_at migration...")
+    migrate()
+    print("Migration script completed.")
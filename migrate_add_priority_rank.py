@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the priority_rank sort key to the Task table.
+
+Adds the column if it is missing, backfills it from each task's priority and
+creates its index. Safe to run repeatedly, on both SQLite and PostgreSQL. New
+and edited tasks keep the column in sync through the model.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from models.models import Task
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        inspector = db.inspect(db.engine)
+        columns = {column['name'] for column in inspector.get_columns('task')}
+
+        if 'priority_rank' in columns:
+            print("SUCCESS: Column 'priority_rank' already exists")
+        else:
+            print("Adding column 'priority_rank' to task...")
+            db.session.execute(db.text(
+                "ALTER TABLE task ADD COLUMN priority_rank INTEGER NOT NULL DEFAULT 99"
+            ))
+            db.session.commit()
+            print("SUCCESS: Column 'priority_rank' added")
+
+        # Backfill every task whose rank doesn't match its priority
+        rank = db.case(Task.PRIORITY_RANKS, value=Task.priority, else_=99)
+        updated = Task.query.filter(Task.priority_rank != rank).update(
+            {Task.priority_rank: rank}, synchronize_session=False
+        )
+        db.session.commit()
+        print(f"SUCCESS: Backfilled priority_rank of {updated} task(s)")
+
+        existing = {index['name'] for index in inspector.get_indexes('task')}
+        for index in Task.__table__.indexes:
+            if 'priority_rank' in index.columns and index.name not in existing:
+                index.create(bind=db.engine, checkfirst=True)
+                print(f"SUCCESS: Created index '{index.name}'")
+
+if __name__ == '__main__':
+    print("Starting priority_rank migration...")
+    migrate()
+    print("Migration script completed.")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Migration script for the content-addressed upload store.
+
+Creates the stored_file table, adds the file_sha256 (referencing stored_file)
+and file_name columns to the task and submission tables and moves every file uploaded before the store into
+it, so identical copies are kept only once. Safe to run repeatedly, on both
+SQLite and PostgreSQL.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from app.file_store import store_file
+from models.models import Task, Submission, attachment_name
+
+def add_columns(table):
+    inspector = db.inspect(db.engine)
+    columns = {column['name'] for column in inspector.get_columns(table)}
+    for name, definition in [('file_sha256', 'VARCHAR(64) REFERENCES stored_file (sha256)'), ('file_name', 'VARCHAR(255)')]:
+        if name in columns:
+            print(f"SUCCESS: Column '{table}.{name}' already exists")
+        else:
+            db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+            db.session.commit()
+            print(f"SUCCESS: Column '{table}.{name}' added")
+
+    # Columns added by an earlier run of this script lacked the foreign key
+    foreign_keys = inspector.get_foreign_keys(table)
+    if not any(fk['constrained_columns'] == ['file_sha256'] for fk in foreign_keys):
+        if db.engine.dialect.name == 'sqlite':
+            print(f"WARNING: SQLite can't add a foreign key to '{table}.file_sha256'; recreate the table to enforce it")
+        else:
+            db.session.execute(db.text(
+                f"ALTER TABLE {table} ADD CONSTRAINT {table}_file_sha256_fkey "
+                f"FOREIGN KEY (file_sha256) REFERENCES stored_file (sha256)"
+            ))
+            db.session.commit()
+            print(f"SUCCESS: Added foreign key on '{table}.file_sha256'")
+
+    existing = {index['name'] for index in inspector.get_indexes(table)}
+    for index in db.metadata.tables[table].indexes:
+        if 'file_sha256' in index.columns and index.name not in existing:
+            index.create(bind=db.engine, checkfirst=True)
+            print(f"SUCCESS: Created index '{index.name}'")
+
+def move_legacy_files(model):
+    moved = missing = 0
+    rows = model.query.filter(model.legacy_file_path.isnot(None), model.file_sha256.is_(None)).all()
+    for row in rows:
+        path = row.legacy_file_path
+        if not os.path.exists(path):
+            missing += 1
+            continue
+        row.file_name = attachment_name(None, path)
+        row.file_sha256 = store_file(path)
+        row.legacy_file_path = None
+        # Commit each file, it has already been moved on disk
+        db.session.commit()
+        moved += 1
+    print(f"SUCCESS: Moved {moved} {model.__tablename__} file(s) into the store ({missing} missing on disk)")
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        print("SUCCESS: Table 'stored_file' is ready")
+
+        for table in ('task', 'submission'):
+            add_columns(table)
+
+        for model in (Task, Submission):
+            move_legacy_files(model)
+
+if __name__ == '__main__':
+    print("Starting file store migration...")
+    migrate()
+    print("Migration script completed.")
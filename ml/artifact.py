@@ -0,0 +1,197 @@
+"""Priority model artifact: a JSON header followed by raw NumPy arrays.
+
+Layout: the 8-byte magic ``PRIOMDL1``, the header length as a little-endian
+uint32, the UTF-8 JSON header, then each array at the offset the header gives
+(64-byte aligned). The header describes the hashing vectorizer, the classes and
+the dtype/shape/offset of each array, so loading never unpickles anything and
+the arrays are memory-mapped: worker processes share one copy through the page
+cache. Inference re-implements the vectorizer (tokenizer + MurmurHash3) and the
+naive Bayes scoring with NumPy only, so scikit-learn is only needed to train.
+"""
+from collections import Counter
+import json
+import os
+import re
+import struct
+
+import numpy as np
+
+MAGIC = b'PRIOMDL1'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+def murmurhash3_32(data, seed=0):
+    """Signed 32-bit MurmurHash3 (x86) of bytes, as scikit-learn's hashing vectorizer computes it"""
+    c1, c2 = 0xcc9e2d51, 0x1b873593
+    length = len(data)
+    h = seed & 0xffffffff
+
+    blocks_end = length - length % 4
+    for (k,) in struct.iter_unpack('<I', data[:blocks_end]):
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        k = (k * c2) & 0xffffffff
+        h ^= k
+        h = ((h << 13) | (h >> 19)) & 0xffffffff
+        h = (h * 5 + 0xe6546b64) & 0xffffffff
+
+    tail = data[blocks_end:]
+    k = 0
+    if len(tail) == 3:
+        k ^= tail[2] << 16
+    if len(tail) >= 2:
+        k ^= tail[1] << 8
+    if tail:
+        k ^= tail[0]
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        k = (k * c2) & 0xffffffff
+        h ^= k
+
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+    return h - 0x100000000 if h & 0x80000000 else h
+
+
+class HashingFeatures:
+    """Pure-Python equivalent of HashingVectorizer(alternate_sign=False, norm=None)"""
+
+    def __init__(self, n_features, ngram_range=(1, 1), lowercase=True, token_pattern=r'(?u)\b\w\w+\b'):
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.lowercase = lowercase
+        self._tokenize = re.compile(token_pattern).findall
+
+    def _ngrams(self, text):
+        if self.lowercase:
+            text = text.lower()
+        tokens = self._tokenize(text)
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for i in range(len(tokens) - n + 1):
+                yield ' '.join(tokens[i:i + n])
+
+    def _index(self, term):
+        h = murmurhash3_32(term.encode('utf-8'))
+        if h == -0x80000000:
+            return (0x7fffffff - (self.n_features - 1)) % self.n_features
+        return abs(h) % self.n_features
+
+    def transform_one(self, text):
+        """Return (indices, counts) arrays of a text's hashed term counts"""
+        counts = Counter(self._index(term) for term in self._ngrams(text or ''))
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        return indices, values
+
+
+class PriorityModel:
+    """Multinomial naive Bayes over hashed features, read from an artifact"""
+
+    def __init__(self, header, arrays):
+        self.header = header
+        self.classes = header['classes']
+        vectorizer = header['vectorizer']
+        self.features = HashingFeatures(
+            vectorizer['n_features'],
+            vectorizer['ngram_range'],
+            vectorizer['lowercase'],
+            vectorizer['token_pattern']
+        )
+        self.feature_log_prob = arrays['feature_log_prob']
+        self.class_log_prior = arrays['class_log_prior']
+
+    @property
+    def metrics(self):
+        return self.header.get('metrics', {})
+
+    def predict_many(self, texts):
+        """Predict the class of each text: argmax of log prior + counts . feature log probabilities"""
+        predictions = []
+        for text in texts:
+            indices, counts = self.features.transform_one(text)
+            scores = self.class_log_prior + self.feature_log_prob[:, indices] @ counts
+            predictions.append(self.classes[int(np.argmax(scores))])
+        return predictions
+
+    def predict(self, text):
+        return self.predict_many([text])[0]
+
+
+def save_model(path, vectorizer, model, metrics=None):
+    """Write a fitted HashingVectorizer + MultinomialNB pair as an artifact.
+
+    Only reads the fitted attributes, so scikit-learn isn't imported here. The
+    file is written next to ``path`` then renamed over it, so readers never see
+    a partial artifact.
+    """
+    if getattr(vectorizer, 'alternate_sign', True) or vectorizer.norm is not None or vectorizer.analyzer != 'word':
+        raise ValueError('Only word HashingVectorizer(alternate_sign=False, norm=None) models can be saved')
+
+    arrays = {
+        'class_log_prior': np.ascontiguousarray(model.class_log_prior_, dtype='<f8'),
+        'feature_log_prob': np.ascontiguousarray(model.feature_log_prob_, dtype='<f4')
+    }
+    header = {
+        'format': FORMAT_VERSION,
+        'vectorizer': {
+            'type': 'hashing',
+            'n_features': int(vectorizer.n_features),
+            'ngram_range': list(vectorizer.ngram_range),
+            'lowercase': bool(vectorizer.lowercase),
+            'token_pattern': vectorizer.token_pattern
+        },
+        'classes': [str(c) for c in model.classes_],
+        'metrics': metrics or {},
+        'arrays': {}
+    }
+
+    # Array offsets depend on the header size, which depends on the offsets;
+    # lay them out from a generous estimate of where the header ends
+    def layout(data_start):
+        offset = data_start
+        for name, array in arrays.items():
+            header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = _align(offset + array.nbytes)
+        return json.dumps(header).encode('utf-8')
+
+    data_start = _align(len(MAGIC) + 4 + len(layout(0)) + 256)
+    encoded = layout(data_start)
+    assert len(MAGIC) + 4 + len(encoded) <= data_start
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(header['arrays'][name]['offset'])
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_model(path):
+    """Memory-map an artifact and return a PriorityModel"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a priority model artifact')
+        (header_length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    if header.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported priority model format {header.get('format')}")
+
+    arrays = {
+        name: np.memmap(path, dtype=np.dtype(spec['dtype']), mode='r', offset=spec['offset'], shape=tuple(spec['shape']))
+        for name, spec in header['arrays'].items()
+    }
+    return PriorityModel(header, arrays)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
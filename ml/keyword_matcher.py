@@ -0,0 +1,49 @@
+import json
+import re
+
+
+class KeywordMatcher:
+    """Rule-based priority classifier compiled into a single regular expression.
+
+    ``tiers`` is an ordered list of ``(priority, keywords)``; a text gets the
+    priority of the first tier with a keyword in it, or ``default`` when none
+    matches. Keywords match whole words only (plurals included), case-insensitively,
+    and multi-word keywords allow any whitespace between their words, so "test"
+    matches "tests" but not "contest". All tiers are scanned in one pass over the
+    text.
+    """
+
+    def __init__(self, tiers, default='medium_priority'):
+        self.priorities = [priority for priority, _ in tiers]
+        self.default = default
+
+        alternatives = []
+        for index, (_, keywords) in enumerate(tiers):
+            # Longest keywords first, so "major assignment" wins over "assignment"
+            words = sorted(keywords, key=len, reverse=True)
+            pattern = '|'.join(r'\s+'.join(map(re.escape, keyword.split())) for keyword in words)
+            if pattern:
+                alternatives.append(f'(?P<t{index}>(?:{pattern})s?)')
+        self._regex = re.compile(r'\b(?:' + '|'.join(alternatives) + r')\b', re.IGNORECASE) if alternatives else None
+
+    @classmethod
+    def from_file(cls, path):
+        """Load tiers from a JSON file: {"default": ..., "tiers": [{"priority": ..., "keywords": [...]}]}"""
+        with open(path) as f:
+            config = json.load(f)
+        tiers = [(tier['priority'], tier['keywords']) for tier in config['tiers']]
+        return cls(tiers, default=config.get('default', 'medium_priority'))
+
+    def classify(self, text):
+        """Return the priority of a text"""
+        if self._regex is None or not text:
+            return self.default
+
+        best = None
+        for match in self._regex.finditer(text):
+            tier = int(match.lastgroup[1:])
+            if best is None or tier < best:
+                best = tier
+                if best == 0:
+                    break
+        return self.default if best is None else self.priorities[best]
@@ -1,37 +1,117 @@
-import re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
-import pickle
+from collections import OrderedDict
 import os
+import threading
+from ml.artifact import load_model, save_model
+from ml.keyword_matcher import KeywordMatcher
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.environ.get('PRIORITY_MODEL_PATH') or os.path.join(ML_DIR, 'priority_model.bin')
+KEYWORDS_PATH = os.environ.get('PRIORITY_KEYWORDS_PATH') or os.path.join(ML_DIR, 'priority_keywords.json')
 
 # Simple keyword-based priority prediction
+_matcher = None
+
+
+def get_keyword_matcher():
+    """Return the keyword matcher built from the PRIORITY_KEYWORDS_PATH rules"""
+    global _matcher
+    if _matcher is None:
+        _matcher = KeywordMatcher.from_file(KEYWORDS_PATH)
+    return _matcher
+
+
 def predict_priority_simple(description):
-    description_lower = description.lower()
-    
-    urgent_keywords = ['urgent', 'deadline', 'due soon', 'important', 'critical', 'exam', 'test', 'final']
-    high_keywords = ['high marks', 'major assignment', 'project', 'presentation']
-    medium_keywords = ['homework', 'assignment', 'reading']
-    low_keywords = ['optional', 'extra', 'practice', 'review']
-    
-    if any(keyword in description_lower for keyword in urgent_keywords):
-        return 'urgent_important'
-    elif any(keyword in description_lower for keyword in high_keywords):
-        return 'high_priority'
-    elif any(keyword in description_lower for keyword in medium_keywords):
-        return 'medium_priority'
-    elif any(keyword in description_lower for keyword in low_keywords):
-        return 'optional'
-    else:
-        return 'medium_priority'
-
-# ML-based prediction (placeholder for trained model)
+    return get_keyword_matcher().classify(description)
+
+
+class PriorityPredictor:
+    """Priority prediction service shared by the requests of a process.
+
+    The trained model artifact is memory-mapped once and reloaded when the
+    model file's modification time changes, so a newly trained model is picked
+    up without a restart. Without a model file the keyword rules are used.
+    Recent predictions are memoized in an LRU keyed by description.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, cache_size=1024):
+        self.model_path = model_path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._model = None
+        self._mtime = None
+        self._cache = OrderedDict()
+
+    def _current_model(self):
+        """Return the loaded PriorityModel, reloading it if the file changed"""
+        try:
+            mtime = os.stat(self.model_path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            if mtime != self._mtime:
+                if mtime is None:
+                    self._model = None
+                else:
+                    self._model = load_model(self.model_path)
+                self._mtime = mtime
+                self._cache.clear()
+            return self._model
+
+    def predict_many(self, descriptions):
+        """Predict the priority of several descriptions, scoring the uncached ones in one batch"""
+        descriptions = list(descriptions)
+        model = self._current_model()
+
+        results = {}
+        with self._lock:
+            for description in descriptions:
+                if description in self._cache:
+                    self._cache.move_to_end(description)
+                    results[description] = self._cache[description]
+        missing = [d for d in dict.fromkeys(descriptions) if d not in results]
+
+        if missing:
+            if model is None:
+                classify = get_keyword_matcher().classify
+                predicted = [classify(description) for description in missing]
+            else:
+                predicted = model.predict_many(missing)
+            with self._lock:
+                for description, priority in zip(missing, predicted):
+                    results[description] = self._cache[description] = priority
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return [results[description] for description in descriptions]
+
+    def predict(self, description):
+        """Predict the priority of one description"""
+        return self.predict_many([description])[0]
+
+
+_predictor = PriorityPredictor()
+
+
+def get_predictor():
+    """Return the process-wide priority predictor"""
+    return _predictor
+
+
+# ML-based prediction, falling back to keyword matching until a model is trained
 def predict_priority(description):
-    # For now, use simple keyword matching
-    # In a real implementation, load a trained model
-    return predict_priority_simple(description)
+    return _predictor.predict(description)
 
-# Function to train model (to be called separately)
+
+def predict_priorities(descriptions):
+    """Batch version of predict_priority, e.g. for bulk imports"""
+    return _predictor.predict_many(descriptions)
+
+# Function to train model on sample data (see train_priority_model.py for the task history)
 def train_model():
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+
     # Sample training data
     descriptions = [
         "Complete the math exam by tomorrow",
@@ -55,24 +135,15 @@ def train_model():
         'optional'
     ]
     
-    vectorizer = TfidfVectorizer()
-    X = vectorizer.fit_transform(descriptions)
+    vectorizer = HashingVectorizer(n_features=2 ** 18, alternate_sign=False, norm=None)
+    X = vectorizer.transform(descriptions)
     
     model = MultinomialNB()
     model.fit(X, priorities)
     
     # Save model
-    with open('ml/priority_model.pkl', 'wb') as f:
-        pickle.dump((vectorizer, model), f)
+    save_model(MODEL_PATH, vectorizer, model)
 
 # Load and use trained model
 def predict_priority_ml(description):
-    model_path = 'ml/priority_model.pkl'
-    if os.path.exists(model_path):
-        with open(model_path, 'rb') as f:
-            vectorizer, model = pickle.load(f)
-        
-        X = vectorizer.transform([description])
-        return model.predict(X)[0]
-    else:
-        return predict_priority_simple(description)
\ No newline at end of file
+    return _predictor.predict(description)
@@ -0,0 +1,135 @@
+"""Offline training of the priority model on the task history.
+
+Tasks are streamed from the database in keyset-paginated chunks, vectorized
+with a stateless HashingVectorizer and fed to MultinomialNB.partial_fit, so
+memory stays bounded by the chunk size whatever the number of tasks. A
+deterministic slice of the tasks (by id) is held out and scored in a second
+pass. Requires scikit-learn, which the web app itself does not need.
+"""
+from datetime import datetime
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+from app import db
+from ml.artifact import save_model
+from models.models import Task
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+
+def make_vectorizer(n_features=2 ** 20):
+    """Stateless vectorizer with non-negative counts, as MultinomialNB needs"""
+    return HashingVectorizer(
+        n_features=n_features,
+        alternate_sign=False,
+        norm=None,
+        lowercase=True,
+        ngram_range=(1, 2)
+    )
+
+
+def iter_task_chunks(chunk_size, holdout_percent, evaluation):
+    """Yield (descriptions, priorities) chunks of tasks, paginated by id.
+
+    A task is in the evaluation split when ``id % 100 < holdout_percent``, so
+    the split is stable between runs and computed by the database.
+    """
+    in_holdout = (Task.id % 100) < holdout_percent
+    last_id = 0
+    while True:
+        rows = db.session.query(Task.id, Task.description, Task.priority).filter(
+            Task.id > last_id,
+            in_holdout if evaluation else ~in_holdout,
+            Task.description.isnot(None),
+            Task.priority.isnot(None)
+        ).order_by(Task.id).limit(chunk_size).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield [row.description for row in rows], [row.priority for row in rows]
+        # Don't keep the chunk's rows in the session
+        db.session.expunge_all()
+
+
+def train(chunk_size=5000, holdout=0.1, n_features=2 ** 20, alpha=0.1):
+    """Train a priority model on the tasks in the database.
+
+    Returns ``(vectorizer, model, metrics)``; ``metrics`` has the split sizes,
+    the holdout accuracy and per-class precision/recall/support.
+    """
+    started = time.monotonic()
+    holdout_percent = int(round(holdout * 100))
+
+    classes = sorted(
+        priority for (priority,) in
+        db.session.query(Task.priority).filter(Task.priority.isnot(None)).distinct()
+    )
+    if not classes:
+        raise ValueError('No tasks with a priority to train on')
+
+    vectorizer = make_vectorizer(n_features)
+    model = MultinomialNB(alpha=alpha)
+
+    train_count = 0
+    for descriptions, priorities in iter_task_chunks(chunk_size, holdout_percent, evaluation=False):
+        model.partial_fit(vectorizer.transform(descriptions), priorities, classes=classes)
+        train_count += len(descriptions)
+    if not train_count:
+        raise ValueError('No training tasks left after the holdout split')
+
+    # Confusion counts of the holdout split, rows are true classes
+    index = {priority: i for i, priority in enumerate(model.classes_)}
+    confusion = np.zeros((len(index), len(index)), dtype=np.int64)
+    for descriptions, priorities in iter_task_chunks(chunk_size, holdout_percent, evaluation=True):
+        predicted = model.predict(vectorizer.transform(descriptions))
+        for actual, guess in zip(priorities, predicted):
+            confusion[index[actual], index[guess]] += 1
+
+    eval_count = int(confusion.sum())
+    per_class = {}
+    for priority, i in index.items():
+        predicted_count = confusion[:, i].sum()
+        support = confusion[i, :].sum()
+        per_class[str(priority)] = {
+            'precision': float(confusion[i, i] / predicted_count) if predicted_count else None,
+            'recall': float(confusion[i, i] / support) if support else None,
+            'support': int(support)
+        }
+
+    metrics = {
+        'trained_at': datetime.utcnow().isoformat(),
+        'train_size': train_count,
+        'eval_size': eval_count,
+        'accuracy': float(np.trace(confusion) / eval_count) if eval_count else None,
+        'classes': per_class,
+        'params': {'chunk_size': chunk_size, 'holdout': holdout, 'n_features': n_features, 'alpha': alpha},
+        'elapsed': time.monotonic() - started
+    }
+    return vectorizer, model, metrics
+
+
+def save_artifact(vectorizer, model, metrics, models_dir=MODELS_DIR, publish_path=None):
+    """Write a versioned model artifact and its metrics to ``models_dir``.
+
+    With ``publish_path`` the artifact is also copied there atomically; the
+    running predictors pick it up on their next call. Returns the artifact path.
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    version = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    artifact_path = os.path.join(models_dir, f'priority-{version}.bin')
+
+    save_model(artifact_path, vectorizer, model, dict(metrics, version=version))
+    with open(os.path.join(models_dir, f'priority-{version}.json'), 'w') as f:
+        json.dump(dict(metrics, version=version), f, indent=2)
+
+    if publish_path:
+        tmp_path = publish_path + '.tmp'
+        shutil.copyfile(artifact_path, tmp_path)
+        os.replace(tmp_path, publish_path)
+    return artifact_path
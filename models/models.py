@@ -1,11 +1,68 @@
 from datetime import datetime, timedelta
+import os
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app
 from flask_login import UserMixin
 from app import db, login_manager
+from app.cache import TTLCache
+from app.events import publish_after_commit
+
+class UserPrincipal(UserMixin):
+    """Read-only stand-in for the logged-in User built from cached columns.
+
+    The columns in ``FIELDS`` are answered without touching the database; any
+    other attribute (relationships, methods) loads the User row on first use
+    and is read from it.
+    """
+    FIELDS = ('id', 'name', 'email', 'user_type', 'subject', 'class_id', 'created_at')
+
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        user = self.__dict__.get('_user')
+        if user is None:
+            user = self.__dict__['_user'] = db.session.get(User, self.id)
+        return getattr(user, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __repr__(self):
+        return f'<UserPrincipal {self.id}: {self.email}>'
+
+_principal_cache = None
+
+def _get_principal_cache():
+    global _principal_cache
+    if _principal_cache is None:
+        _principal_cache = TTLCache(current_app.config['USER_CACHE_TTL'], maxsize=10000)
+    return _principal_cache
+
+def invalidate_user(user_id):
+    """Drop a user's cached principal; call after changing or deleting the user.
+
+    Only this process's cache is cleared; other workers keep theirs for up to
+    ``USER_CACHE_TTL`` seconds.
+    """
+    if _principal_cache is not None:
+        _principal_cache.pop(int(user_id))
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    cache = _get_principal_cache()
+    fields = cache.get(user_id)
+    if fields is None:
+        row = db.session.execute(
+            db.select(*(getattr(User, field) for field in UserPrincipal.FIELDS)).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        fields = cache.set(user_id, dict(row._mapping))
+    return UserPrincipal(fields)
 
 # Association table for teacher-class many-to-many relationship
 teacher_classes = db.Table('teacher_classes',
@@ -70,6 +127,7 @@ class User(UserMixin, db.Model):
     subject = db.Column(db.String(100))  # for teachers
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'))  # for students
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime)  # last request, written by app.presence
 
     # Relationships
     created_tasks = db.relationship('Task', backref='creator', lazy=True, foreign_keys='[Task.created_by]')
@@ -78,33 +136,88 @@ class User(UserMixin, db.Model):
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
+        if self.id is not None:
+            invalidate_user(self.id)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+def attachment_path(sha256, legacy_path):
+    """Path on disk of a task or submission file, in the file store or from before it"""
+    if sha256:
+        from app.file_store import object_path
+        return object_path(sha256)
+    return legacy_path
+
+def attachment_name(file_name, legacy_path):
+    """Name a task or submission file is downloaded as"""
+    if file_name or not legacy_path:
+        return file_name
+    # Legacy files are saved as "<uuid4>_<name>"
+    return os.path.basename(legacy_path).split('_', 1)[-1]
+
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    deadline = db.Column(db.DateTime, nullable=False)
+    deadline = db.Column(db.DateTime, nullable=False, index=True)
     priority = db.Column(db.String(50), nullable=False)
     instructions = db.Column(db.Text)
-    file_path = db.Column(db.String(500))  # Path to uploaded task file
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    assigned_teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Teacher assigned by admin
+    legacy_file_path = db.Column('file_path', db.String(500))  # Path of a file uploaded before the file store
+    file_sha256 = db.Column(db.String(64), db.ForeignKey('stored_file.sha256'), nullable=True, index=True)  # attached file in the store
+    file_name = db.Column(db.String(255), nullable=True)  # name the attached file was uploaded under
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    assigned_teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)  # Teacher assigned by admin
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    priority_rank = db.Column(db.Integer, nullable=False, default=99, index=True)  # sort key derived from priority
 
     # Relationships
     assignments = db.relationship('Assignment', backref='task', lazy=True)
     assigned_classes = db.relationship('Class', secondary=task_classes, backref='tasks', lazy=True)
     assigned_teacher = db.relationship('User', backref='assigned_tasks', foreign_keys=[assigned_teacher_id], lazy=True)
 
+    @property
+    def file_path(self):
+        return attachment_path(self.file_sha256, self.legacy_file_path)
+
+    @property
+    def download_name(self):
+        return attachment_name(self.file_name, self.legacy_file_path)
+
     @property
     def is_overdue(self):
         from datetime import datetime
         return datetime.utcnow() > self.deadline
 
+    # Order in which students see their tasks, most pressing first (unknown priorities last)
+    PRIORITY_RANKS = {
+        'urgent_important': 1,
+        'important_not_urgent': 2,
+        'urgent_not_important': 3,
+        'high_priority': 4,
+        'medium_priority': 5,
+        'low_priority': 6,
+        'long_term': 7,
+        'group_task': 8,
+        'optional': 9,
+        'not_important_not_urgent': 10
+    }
+
+    @staticmethod
+    def rank_for(priority):
+        return Task.PRIORITY_RANKS.get(priority, 99)
+
+@db.event.listens_for(Task.priority, 'set')
+def _sync_priority_rank(task, priority, oldvalue, initiator):
+    """Keep priority_rank in sync whenever a task's priority is set"""
+    task.priority_rank = Task.rank_for(priority)
+
 class Assignment(db.Model):
+    __table_args__ = (
+        db.Index('ix_assignment_student_status', 'student_id', 'status'),
+        db.Index('ix_assignment_task_student', 'task_id', 'student_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -125,9 +238,11 @@ class Assignment(db.Model):
 
 class Submission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False, index=True)
     content = db.Column(db.Text)
-    file_path = db.Column(db.String(500))
+    legacy_file_path = db.Column('file_path', db.String(500))  # Path of a file uploaded before the file store
+    file_sha256 = db.Column(db.String(64), db.ForeignKey('stored_file.sha256'), nullable=True, index=True)  # attached file in the store
+    file_name = db.Column(db.String(255), nullable=True)  # name the attached file was uploaded under
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Feedback fields
@@ -136,7 +251,43 @@ class Submission(db.Model):
     feedback_provided_at = db.Column(db.DateTime, nullable=True)  # When feedback was provided
     graded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Teacher who graded
 
+    @property
+    def file_path(self):
+        return attachment_path(self.file_sha256, self.legacy_file_path)
+
+    @property
+    def download_name(self):
+        return attachment_name(self.file_name, self.legacy_file_path)
+
+class Upload(db.Model):
+    """A file being uploaded in chunks, until it is attached to a task or submission"""
+    PURPOSES = ('task', 'submission')
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, also names the partial file
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    purpose = db.Column(db.String(20), nullable=False)  # task, submission
+    filename = db.Column(db.String(255), nullable=False)  # sanitized original name
+    size = db.Column(db.BigInteger, nullable=False)  # total bytes announced by the client
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # bytes written so far
+    sha256 = db.Column(db.String(64), db.ForeignKey('stored_file.sha256'), nullable=True)  # set once complete and stored
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    @property
+    def is_complete(self):
+        return self.sha256 is not None
+
+class StoredFile(db.Model):
+    """Content in the upload store, shared by every task, submission and upload with the same SHA-256"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # attachments and uploads pointing at it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Notification(db.Model):
+    __table_args__ = (
+        db.Index('ix_notification_user_read_expires', 'user_id', 'is_read', 'expires_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -144,7 +295,7 @@ class Notification(db.Model):
     notification_type = db.Column(db.String(50), nullable=False, default='info')  # info, success, warning, error
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
     
     # Relationships
     user = db.relationship('User', backref='notifications', lazy=True)
@@ -153,6 +304,11 @@ class Notification(db.Model):
         if self.expires_at is None:
             return False
         return datetime.utcnow() > self.expires_at
+
+    @staticmethod
+    def channel(user_id):
+        """Event hub channel that wakes a user's waiting notification requests"""
+        return f'user:{user_id}'
     
     @staticmethod
     def create_notification(user_id, title, message, notification_type='info', expires_in_hours=None):
@@ -169,38 +325,124 @@ class Notification(db.Model):
             expires_at=expires_at
         )
         db.session.add(notification)
+        publish_after_commit(db.session, Notification.channel(user_id))
         db.session.commit()
         return notification
     
     @staticmethod
-    def create_system_notification(title, message, notification_type='info', target_users='all', expires_in_hours=24):
-        """Create system notifications for multiple users"""
-        from models.models import User
+    def create_notifications(user_ids, title, message, notification_type='info', expires_in_hours=None, commit=True):
+        """Create the same notification for many users with one bulk insert"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+
+        created_at = datetime.utcnow()
+        expires_at = None
+        if expires_in_hours:
+            expires_at = created_at + timedelta(hours=expires_in_hours)
+
+        db.session.execute(Notification.__table__.insert(), [{
+            'user_id': user_id,
+            'title': title,
+            'message': message,
+            'notification_type': notification_type,
+            'is_read': False,
+            'created_at': created_at,
+            'expires_at': expires_at
+        } for user_id in user_ids])
+        for user_id in user_ids:
+            publish_after_commit(db.session, Notification.channel(user_id))
+        if commit:
+            db.session.commit()
+        return len(user_ids)
+
+    @staticmethod
+    def create_system_notification(title, message, notification_type='info', target_users='all', expires_in_hours=24, created_by=None):
+        """Create a system notification for a group of users.
+
+        The announcement is stored once as a Broadcast; read state is kept per
+        user in BroadcastReceipt rows written only when someone reads it.
+        Returns the number of users the announcement targets.
+        """
+        recipients = Broadcast.recipients_query(target_users)
+        if recipients is None:
+            return 0
         
-        if target_users == 'all':
-            users = User.query.all()
-        elif target_users == 'teachers':
-            users = User.query.filter_by(user_type='teacher').all()
-        elif target_users == 'students':
-            users = User.query.filter_by(user_type='student').all()
-        else:
-            return []
+        broadcast = Broadcast(
+            title=title,
+            message=message,
+            notification_type=notification_type,
+            target_users=target_users,
+            created_by=created_by
+        )
+        if expires_in_hours:
+            broadcast.expires_at = datetime.utcnow() + timedelta(hours=expires_in_hours)
+        db.session.add(broadcast)
         
-        notifications = []
-        for user in users:
-            expires_at = datetime.utcnow() + timedelta(hours=expires_in_hours)
-            notification = Notification(
-                user_id=user.id,
-                title=title,
-                message=message,
-                notification_type=notification_type,
-                expires_at=expires_at
-            )
-            db.session.add(notification)
-            notifications.append(notification)
+        # Wake every user currently waiting for notifications in this process
+        from app.events import get_hub
+        for channel in get_hub().channels('user:'):
+            publish_after_commit(db.session, channel)
         
         db.session.commit()
-        return notifications
+        return recipients.count()
+
+class Broadcast(db.Model):
+    """A system announcement stored once for all of its recipients"""
+    __table_args__ = (
+        db.Index('ix_broadcast_target_created', 'target_users', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50), nullable=False, default='info')
+    target_users = db.Column(db.String(20), nullable=False, default='all')  # all, teachers, students
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+    # Relationships
+    receipts = db.relationship('BroadcastReceipt', backref='broadcast', lazy=True, cascade='all, delete-orphan')
+
+    # target_users value matching each user type
+    TARGETS = {'teacher': 'teachers', 'student': 'students'}
+
+    def is_expired(self):
+        if self.expires_at is None:
+            return False
+        return datetime.utcnow() > self.expires_at
+
+    @staticmethod
+    def recipients_query(target_users):
+        """Query for the users a broadcast to ``target_users`` reaches (None if unknown)"""
+        if target_users == 'all':
+            return User.query
+        for user_type, target in Broadcast.TARGETS.items():
+            if target_users == target:
+                return User.query.filter_by(user_type=user_type)
+        return None
+
+    @staticmethod
+    def visible_to(user):
+        """Filter criteria for the broadcasts a user receives.
+
+        Like per-user notifications used to, a broadcast only reaches users who
+        already existed when it was sent.
+        """
+        targets = ['all']
+        if user.user_type in Broadcast.TARGETS:
+            targets.append(Broadcast.TARGETS[user.user_type])
+        criteria = [Broadcast.target_users.in_(targets)]
+        if user.created_at is not None:
+            criteria.append(Broadcast.created_at >= user.created_at)
+        return criteria
+
+class BroadcastReceipt(db.Model):
+    """Read receipt of a broadcast by one user"""
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    read_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class ContactMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -234,6 +476,11 @@ class ChatRoom(db.Model):
     
     def __repr__(self):
         return f'<ChatRoom {self.id}: {self.name}>'
+
+    @staticmethod
+    def channel(room_id):
+        """Event hub channel carrying a room's new, edited and deleted messages"""
+        return f'room:{room_id}'
     
     @staticmethod
     def get_or_create_class_room(class_id, creator_id):
@@ -271,6 +518,10 @@ class ChatRoom(db.Model):
 
 class ChatMessage(db.Model):
     """Model for chat messages"""
+    __table_args__ = (
+        db.Index('ix_chat_message_room_deleted_id', 'room_id', 'is_deleted', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.Integer, db.ForeignKey('chat_room.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -288,3 +539,29 @@ class ChatMessage(db.Model):
     def formatted_time(self):
         """Return formatted time for display"""
         return self.created_at.strftime('%Y-%m-%d %H:%M')
+
+
+class Job(db.Model):
+    """A unit of background work run by the worker (see ``app/jobs.py``)"""
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # registered handler
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments of the handler
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=True)  # enqueueing the same key twice is a no-op
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not picked up before then
+    locked_by = db.Column(db.String(100), nullable=True)  # worker running it
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<Job {self.id}: {self.name} {self.status}>'
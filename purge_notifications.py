@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Retention job for the notification tables.
+
+Deletes expired notifications, read notifications older than the retention of
+their type, and expired broadcasts with their read receipts, in bounded batches
+so it can run next to live traffic. Schedule it periodically (e.g. from cron or
+a Render cron job):
+
+    python purge_notifications.py
+    python purge_notifications.py --retention "info=7,warning=30,default=30"
+    python purge_notifications.py --batch-size 500 --dry-run
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.retention import parse_retention, purge_notifications
+
+def purge(retention=None, batch_size=None, dry_run=False):
+    app = create_app()
+
+    with app.app_context():
+        if retention is None:
+            retention = parse_retention(app.config['NOTIFICATION_RETENTION'])
+        if batch_size is None:
+            batch_size = app.config['NOTIFICATION_PURGE_BATCH_SIZE']
+
+        result = purge_notifications(retention, batch_size=batch_size, dry_run=dry_run)
+        action = "Would delete" if dry_run else "Deleted"
+        print(f"[OK] {action} {result['expired']} expired notification(s)")
+        print(f"[OK] {action} {result['read']} read notification(s) past retention")
+        print(f"[OK] {action} {result['broadcasts']} expired broadcast(s)")
+        print(f"[OK] Finished in {result['elapsed']:.2f}s")
+        return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Purge expired and old read notifications')
+    parser.add_argument('--retention', help='days read notifications are kept per type, e.g. "info=7,default=30"')
+    parser.add_argument('--batch-size', type=int, help='rows deleted per transaction')
+    parser.add_argument('--dry-run', action='store_true', help='only count the rows that would be deleted')
+    args = parser.parse_args()
+
+    purge(
+        retention=parse_retention(args.retention) if args.retention else None,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run
+    )
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Background reconciler for class task assignments.
+
+Creates the assignments missing for students of classes a task was assigned to,
+removes orphaned assignments and marks pending assignments past their deadline
+as overdue. Run it periodically (e.g. from cron or a Render cron job) so the
+dashboards never have to write:
+
+    python reconcile_assignments.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.assignments import reconcile_class_assignments
+
+def reconcile():
+    app = create_app()
+
+    with app.app_context():
+        result = reconcile_class_assignments()
+        print(f"[OK] Created {result['created']} missing assignment(s)")
+        print(f"[OK] Removed {result['orphaned']} orphaned assignment(s)")
+        print(f"[OK] Marked {result['overdue']} assignment(s) as overdue")
+        return result
+
+if __name__ == '__main__':
+    reconcile()
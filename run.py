@@ -1,3 +1,4 @@
+import os
 from app import create_app, db
 from models.models import User, Task, Assignment, Submission
 
@@ -10,4 +11,11 @@ def make_shell_context():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+    # Process background jobs in this process during development; in production
+    # they are run by the worker (see run_worker.py and the Procfile). Only the
+    # reloader's child serves requests and picks up code changes, so start it there.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from app.jobs import start_worker_thread
+        app.config['JOB_RUN_INLINE'] = False
+        start_worker_thread(app)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Background job worker.
+
+Runs the jobs queued by the web app (notifications, file deletions). Run one or
+more of these next to the web processes, e.g. as the Procfile's worker, and set
+JOB_RUN_INLINE=0 for the web processes so they leave the jobs to it:
+
+    python run_worker.py            # run until stopped
+    python run_worker.py --once     # run the jobs due now and exit
+"""
+
+import sys
+import os
+import argparse
+import signal
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.jobs import default_worker_id, purge_finished_jobs, work
+
+def main():
+    parser = argparse.ArgumentParser(description='Run queued background jobs.')
+    parser.add_argument('--once', action='store_true', help='exit once the queue is empty')
+    parser.add_argument('--poll-interval', type=float, default=None,
+                        help='seconds to wait when the queue is empty (default: JOB_POLL_INTERVAL)')
+    args = parser.parse_args()
+
+    app = create_app()
+    stop = threading.Event()
+    # Finish the current job before exiting
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    with app.app_context():
+        worker_id = default_worker_id()
+        print(f"[OK] Worker {worker_id} started")
+        processed = work(worker_id, once=args.once, poll_interval=args.poll_interval, stop=stop)
+        print(f"[OK] Worker stopped after {processed} job(s)")
+        if args.once:
+            print(f"[OK] Purged {purge_finished_jobs()} finished job(s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+// Live forum updates: subscribes to the room's event stream, renders new,
+// edited and deleted messages in place and posts messages without reloading
+// the page.
+(function () {
+    const container = document.getElementById('messages-container');
+    if (!container || !container.dataset.streamUrl) return;
+
+    const config = container.dataset;
+    const currentUserId = Number(config.userId);
+    const isAdmin = config.isAdmin === 'true';
+    let lastId = Number(config.lastId) || 0;
+
+    function actionUrl(template, messageId) {
+        return template.replace(/\/0\//, `/${messageId}/`);
+    }
+
+    function formatTime(dateString) {
+        const date = new Date(dateString);
+        const pad = value => String(value).padStart(2, '0');
+        return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())} ` +
+               `${pad(date.getHours())}:${pad(date.getMinutes())}`;
+    }
+
+    function element(tag, className, text) {
+        const node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    }
+
+    function renderMessage(message) {
+        const own = message.user_id === currentUserId;
+        const item = element('div', 'forum-message' + (own ? ' own-message' : ''));
+        item.dataset.messageId = message.id;
+
+        const header = element('div', 'message-header');
+        header.appendChild(element('strong', null, message.user_name));
+        // created_at is naive UTC
+        header.appendChild(element('span', 'text-muted small', formatTime(message.created_at + 'Z')));
+        item.appendChild(header);
+        item.appendChild(element('div', 'message-content', message.content));
+
+        if (own || isAdmin) {
+            const actions = element('div', 'message-actions');
+            if (own) {
+                const edit = element('a', 'btn btn-sm btn-outline-primary');
+                edit.href = actionUrl(config.editUrl, message.id);
+                edit.innerHTML = '<i class="fas fa-edit"></i> Edit';
+                actions.appendChild(edit);
+            }
+            const form = element('form');
+            form.action = actionUrl(config.deleteUrl, message.id);
+            form.method = 'POST';
+            form.style.display = 'inline';
+            form.innerHTML = '<button type="submit" class="btn btn-sm btn-outline-danger" ' +
+                'onclick="return confirm(\'Are you sure you want to delete this message?\')">' +
+                '<i class="fas fa-trash"></i> Delete</button>';
+            actions.appendChild(form);
+            item.appendChild(actions);
+        }
+        return item;
+    }
+
+    function findMessage(messageId) {
+        return container.querySelector(`[data-message-id="${messageId}"]`);
+    }
+
+    function addMessage(message) {
+        lastId = Math.max(lastId, message.id);
+        if (findMessage(message.id)) return;
+
+        const empty = container.querySelector('.forum-empty');
+        if (empty) empty.remove();
+
+        const atBottom = container.scrollHeight - container.scrollTop - container.clientHeight < 50;
+        container.appendChild(renderMessage(message));
+        if (atBottom || message.user_id === currentUserId) {
+            container.scrollTop = container.scrollHeight;
+        }
+    }
+
+    function connect() {
+        const source = new EventSource(`${config.streamUrl}?after=${lastId}`);
+        source.addEventListener('new', event => addMessage(JSON.parse(event.data)));
+        source.addEventListener('edited', event => {
+            const message = JSON.parse(event.data);
+            const item = findMessage(message.id);
+            if (item) item.querySelector('.message-content').textContent = message.content;
+        });
+        source.addEventListener('deleted', event => {
+            const item = findMessage(JSON.parse(event.data).id);
+            if (item) item.remove();
+        });
+        source.onerror = () => {
+            // EventSource reconnects by itself unless the server refused the stream
+            if (source.readyState === EventSource.CLOSED) setTimeout(connect, 30000);
+        };
+    }
+
+    const form = document.getElementById('message-form');
+    if (form) {
+        form.addEventListener('submit', event => {
+            event.preventDefault();
+            fetch(form.action, {
+                method: 'POST',
+                body: new FormData(form),
+                headers: { 'X-Requested-With': 'XMLHttpRequest' }
+            })
+                .then(response => {
+                    const isJson = (response.headers.get('Content-Type') || '').includes('application/json');
+                    if (!isJson) throw new Error(`HTTP ${response.status}`);
+                    return response.json().then(data => ({ ok: response.ok, data }));
+                })
+                .then(({ ok, data }) => {
+                    if (!ok) {
+                        alert(data.error || 'Could not post the message');
+                        return;
+                    }
+                    form.reset();
+                    addMessage(data);
+                })
+                // Fall back to a regular form post
+                .catch(() => form.submit());
+        });
+    }
+
+    if (window.EventSource) connect();
+})();
@@ -0,0 +1,116 @@
+// Chunked, resumable uploads: file inputs marked with data-chunked-upload are
+// sent to the upload API in chunks before their form is submitted, and the form
+// only carries the id of the finished upload. Interrupted chunks are retried
+// from the offset the server reports, and an upload of the same file is resumed
+// after a page reload.
+(function () {
+    const MAX_RETRIES = 5;
+
+    function storageKey(file, purpose) {
+        return `upload:${purpose}:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    async function request(method, url, body, headers) {
+        const response = await fetch(url, {
+            method: method,
+            body: body,
+            headers: Object.assign({'X-Requested-With': 'XMLHttpRequest'}, headers || {}),
+            credentials: 'same-origin'
+        });
+        const data = await response.json().catch(() => ({}));
+        return {status: response.status, data: data};
+    }
+
+    async function startUpload(baseUrl, file, purpose) {
+        const key = storageKey(file, purpose);
+        const previous = sessionStorage.getItem(key);
+        if (previous) {
+            const status = await request('GET', `${baseUrl}/${previous}`);
+            if (status.status === 200) return Object.assign({chunk_size: Number(sessionStorage.getItem(key + ':chunk'))}, status.data);
+            sessionStorage.removeItem(key);
+        }
+
+        const created = await request('POST', baseUrl, JSON.stringify({
+            filename: file.name, size: file.size, purpose: purpose
+        }), {'Content-Type': 'application/json'});
+        if (created.status !== 201) throw new Error(created.data.error || 'Upload failed');
+        sessionStorage.setItem(key, created.data.id);
+        sessionStorage.setItem(key + ':chunk', created.data.chunk_size);
+        return created.data;
+    }
+
+    async function sendFile(baseUrl, file, purpose, onProgress) {
+        const upload = await startUpload(baseUrl, file, purpose);
+        const url = `${baseUrl}/${upload.id}`;
+        let offset = upload.offset;
+        let failures = 0;
+
+        while (!upload.complete && offset < file.size) {
+            const end = Math.min(offset + upload.chunk_size, file.size);
+            onProgress(offset / file.size);
+            let result;
+            try {
+                result = await request('PUT', url, file.slice(offset, end), {
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`
+                });
+            } catch (error) {
+                result = {status: 0, data: {}};
+            }
+
+            if (result.status === 200) {
+                offset = result.data.offset;
+                upload.complete = result.data.complete;
+                failures = 0;
+                continue;
+            }
+            if (result.status !== 0 && result.status !== 400 && result.status !== 409 && result.status < 500) {
+                throw new Error(result.data.error || 'Upload failed');
+            }
+            if (++failures > MAX_RETRIES) throw new Error('Upload interrupted, please try again');
+            // Resume from what the server actually received
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            const status = await request('GET', url).catch(() => null);
+            if (status && status.status === 200) {
+                offset = status.data.offset;
+                upload.complete = status.data.complete;
+            }
+        }
+
+        sessionStorage.removeItem(storageKey(file, purpose));
+        sessionStorage.removeItem(storageKey(file, purpose) + ':chunk');
+        onProgress(1);
+        return upload.id;
+    }
+
+    document.querySelectorAll('input[type="file"][data-chunked-upload]').forEach(input => {
+        const form = input.form;
+        const uploadIdField = form && form.querySelector('input[name="upload_id"]');
+        if (!uploadIdField || !window.fetch) return;
+
+        const progress = document.createElement('div');
+        progress.className = 'form-text';
+        input.insertAdjacentElement('afterend', progress);
+
+        form.addEventListener('submit', async event => {
+            const file = input.files[0];
+            if (!file || uploadIdField.value) return;
+            event.preventDefault();
+
+            const buttons = form.querySelectorAll('[type="submit"]');
+            buttons.forEach(button => { button.disabled = true; });
+            try {
+                uploadIdField.value = await sendFile(input.dataset.uploadUrl, file, input.dataset.chunkedUpload, fraction => {
+                    progress.textContent = `Uploading ${file.name}: ${Math.floor(fraction * 100)}%`;
+                });
+                // The file is on the server already, don't post it again
+                input.disabled = true;
+                form.submit();
+            } catch (error) {
+                progress.textContent = error.message;
+                progress.classList.add('text-danger');
+                buttons.forEach(button => { button.disabled = false; });
+            }
+        });
+    });
+})();
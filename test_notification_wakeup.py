@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test that a notification long-poll returns early when the notification is
+written by another process, like the background job worker.
+
+Runs against a throwaway SQLite database, never the application's own.
+"""
+
+import sys
+import os
+import subprocess
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+POLL_TIMEOUT = 10
+
+# Written by a separate Python process, so only the database connects it to the poll
+WRITER = """
+import sys
+sys.path.append({root!r})
+from app import create_app, db
+from models.models import Notification
+app = create_app()
+with app.app_context():
+    Notification.create_notifications([{user_id}], 'From the worker', 'Written by another process')
+"""
+
+def test_notification_wakeup():
+    root = os.path.dirname(os.path.abspath(__file__))
+    database = os.path.join(tempfile.mkdtemp(), 'wakeup.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + database
+
+    from app import create_app, db
+    from models.models import User
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, SESSION_COOKIE_SECURE=False, NOTIFICATION_POLL_TIMEOUT=POLL_TIMEOUT)
+
+    with app.app_context():
+        db.create_all()
+        student = User(name='Student', email='student@example.com', user_type='student')
+        student.set_password('password')
+        db.session.add(student)
+        db.session.commit()
+        user_id = student.id
+
+    client = app.test_client()
+    client.post('/login', data={'email': 'student@example.com', 'password': 'password'})
+
+    def write_later():
+        time.sleep(1)
+        subprocess.run([sys.executable, '-c', WRITER.format(root=root, user_id=user_id)], check=True,
+                       env={**os.environ, 'DATABASE_URL': 'sqlite:///' + database})
+
+    print("=== Notification Wake-up Test ===")
+    writer = threading.Thread(target=write_later)
+    writer.start()
+    started = time.monotonic()
+    response = client.get('/api/notifications/poll?since=0')
+    elapsed = time.monotonic() - started
+    writer.join()
+
+    print(f"Poll answered with {response.status_code} after {elapsed:.1f}s (timeout {POLL_TIMEOUT}s)")
+    if response.status_code == 200 and elapsed < POLL_TIMEOUT / 2 and response.json['notifications']:
+        print("\n=== Test Passed ===")
+        return True
+    print("\n=== Test Failed ===")
+    return False
+
+if __name__ == '__main__':
+    sys.exit(0 if test_notification_wakeup() else 1)
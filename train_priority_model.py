@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Train the task priority model on the task history in the database.
+
+Streams Task.description/Task.priority in chunks, holds out a slice of the
+tasks for evaluation, writes a versioned artifact with its metrics to
+ml/models/ and publishes it as the model predict_priority uses:
+
+    python train_priority_model.py
+    python train_priority_model.py --chunk-size 10000 --holdout 0.2
+    python train_priority_model.py --no-publish
+
+Needs scikit-learn (pip install scikit-learn).
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from ml.priority_predictor import MODEL_PATH
+from ml.training import save_artifact, train
+
+def train_model(chunk_size=5000, holdout=0.1, n_features=2 ** 20, alpha=0.1, publish=True):
+    app = create_app()
+
+    with app.app_context():
+        vectorizer, model, metrics = train(chunk_size, holdout, n_features, alpha)
+        artifact_path = save_artifact(vectorizer, model, metrics, publish_path=MODEL_PATH if publish else None)
+
+        print(f"[OK] Trained on {metrics['train_size']} task(s), evaluated on {metrics['eval_size']}")
+        if metrics['accuracy'] is not None:
+            print(f"[OK] Holdout accuracy: {metrics['accuracy']:.3f}")
+        for priority, scores in metrics['classes'].items():
+            precision = 'n/a' if scores['precision'] is None else f"{scores['precision']:.3f}"
+            recall = 'n/a' if scores['recall'] is None else f"{scores['recall']:.3f}"
+            print(f"     {priority}: precision {precision}, recall {recall}, support {scores['support']}")
+        print(f"[OK] Saved {artifact_path} in {metrics['elapsed']:.1f}s")
+        if publish:
+            print(f"[OK] Published to {MODEL_PATH}")
+        return artifact_path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the task priority model')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='tasks loaded and fitted at a time')
+    parser.add_argument('--holdout', type=float, default=0.1, help='fraction of tasks kept for evaluation')
+    parser.add_argument('--n-features', type=int, default=2 ** 20, help='hashing vectorizer dimension')
+    parser.add_argument('--alpha', type=float, default=0.1, help='naive Bayes smoothing')
+    parser.add_argument('--no-publish', action='store_true', help="don't replace the model used by the app")
+    args = parser.parse_args()
+
+    train_model(args.chunk_size, args.holdout, args.n_features, args.alpha, publish=not args.no_publish)